@@ -0,0 +1,491 @@
+"""Benchmark offline do estudo4.py com um Supabase falso em memória.
+
+Troca o cliente do Supabase por um dublê local da cadeia
+table(...).select/eq/gt/gte/lte/in_/order/limit/range/insert/upsert/execute
+(com latência configurável por chamada), gera dados sintéticos de
+apontamentos e checklists e mede as funções de carga, gravação e montagem
+dos menus.
+
+Uso:
+    python benchmark.py --linhas 10000,100000 --latencia-ms 30 --json resultado.json
+    python benchmark.py --linhas 10000 --comparar resultado.json
+"""
+import argparse
+import bisect
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ITENS = [
+    "ETIQUETA",
+    "PLACA_IMETRO E NÚMERO DE SÉRIE",
+    "TESTE_ABS",
+    "RODAGEM_MODELO",
+    "GRAXEIRAS E ANÉIS ELÁSTICOS",
+    "SISTEMA_ATUACAO",
+    "CATRACA_FREIO",
+    "TAMPA_CUBO",
+    "PINTURA_EIXO",
+    "SOLDA",
+]
+INSPETORES = ["Maria", "Catia", "Vera", "Bruno"]
+TIPOS = ["Eixo", "Manga", "PNM"]
+
+
+# =============================
+# Supabase falso
+# =============================
+class RespostaFalsa:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class TabelaFalsa:
+    """Linhas em ordem de id (permite bisect nos filtros por id) + chaves únicas para o upsert."""
+
+    def __init__(self):
+        self.linhas = []
+        self.ids = []
+        self.proximo_id = 1
+        self.chaves_unicas = {}
+        self.indices = {}
+
+    def inserir(self, linha):
+        linha = dict(linha)
+        linha["id"] = self.proximo_id
+        self.proximo_id += 1
+        self.linhas.append(linha)
+        self.ids.append(linha["id"])
+        for colunas, chaves in self.chaves_unicas.items():
+            chaves.add(tuple(str(linha.get(c)) for c in colunas))
+        for coluna, indice in self.indices.items():
+            indice.setdefault(linha.get(coluna), []).append(linha)
+        return linha
+
+    def indice(self, coluna):
+        """Índice por valor (criado na primeira consulta com eq nessa coluna), em ordem de id."""
+        if coluna not in self.indices:
+            indice = {}
+            for r in self.linhas:
+                indice.setdefault(r.get(coluna), []).append(r)
+            self.indices[coluna] = indice
+        return self.indices[coluna]
+
+    def chaves(self, colunas):
+        if colunas not in self.chaves_unicas:
+            self.chaves_unicas[colunas] = {tuple(str(r.get(c)) for c in colunas) for r in self.linhas}
+        return self.chaves_unicas[colunas]
+
+
+class ConsultaFalsa:
+    def __init__(self, cliente, tabela):
+        self._cliente = cliente
+        self._tabela = cliente.tabelas.setdefault(tabela, TabelaFalsa())
+        self._acao = "select"
+        self._colunas = None
+        self._count = None
+        self._filtros = []
+        self._iguais = []
+        self._id_minimo = None
+        self._id_limite = None
+        self._negar = False
+        self._ordem = None
+        self._limite = None
+        self._intervalo = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignorar_duplicados = False
+
+    # ----- select e filtros -----
+    def select(self, colunas="*", count=None):
+        self._colunas = None if colunas.strip() == "*" else [c.strip() for c in colunas.split(",")]
+        self._count = count
+        return self
+
+    def _filtro(self, coluna, pred):
+        if self._negar:
+            self._negar = False
+            self._filtros.append(lambda r: not pred(r.get(coluna)))
+        else:
+            self._filtros.append(lambda r: pred(r.get(coluna)))
+        return self
+
+    def eq(self, coluna, valor):
+        if not self._negar:
+            self._iguais.append((coluna, valor))
+        return self._filtro(coluna, lambda x: x == valor)
+
+    def gt(self, coluna, valor):
+        if coluna == "id":
+            self._id_minimo = valor
+            return self
+        return self._filtro(coluna, lambda x: x is not None and x > valor)
+
+    def gte(self, coluna, valor):
+        return self._filtro(coluna, lambda x: x is not None and x >= valor)
+
+    def lte(self, coluna, valor):
+        return self._filtro(coluna, lambda x: x is not None and x <= valor)
+
+    def lt(self, coluna, valor):
+        if coluna == "id":
+            self._id_limite = valor
+            return self
+        return self._filtro(coluna, lambda x: x is not None and x < valor)
+
+    def in_(self, coluna, valores):
+        valores = set(valores)
+        return self._filtro(coluna, lambda x: x in valores)
+
+    def is_(self, coluna, valor):
+        return self._filtro(coluna, lambda x: x is None if valor == "null" else x == valor)
+
+    @property
+    def not_(self):
+        self._negar = True
+        return self
+
+    def order(self, coluna, desc=False):
+        self._ordem = (coluna, desc)
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def range(self, inicio, fim):
+        self._intervalo = (inicio, fim)
+        return self
+
+    # ----- escrita -----
+    def insert(self, linhas):
+        self._acao = "insert"
+        self._payload = linhas if isinstance(linhas, list) else [linhas]
+        return self
+
+    def upsert(self, linhas, on_conflict=None, ignore_duplicates=False):
+        self._acao = "upsert"
+        self._payload = linhas if isinstance(linhas, list) else [linhas]
+        self._on_conflict = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else None
+        self._ignorar_duplicados = ignore_duplicates
+        return self
+
+    def execute(self):
+        self._cliente.esperar()
+        if self._acao == "insert":
+            return RespostaFalsa([self._tabela.inserir(r) for r in self._payload])
+        if self._acao == "upsert":
+            return RespostaFalsa(self._executar_upsert())
+        return self._executar_select()
+
+    def _executar_upsert(self):
+        chaves = self._tabela.chaves(self._on_conflict) if self._on_conflict else None
+        inseridas = []
+        for linha in self._payload:
+            if chaves is not None:
+                chave = tuple(str(linha.get(c)) for c in self._on_conflict)
+                if chave in chaves:
+                    if self._ignorar_duplicados:
+                        continue
+                    raise ValueError(f"duplicate key value violates unique constraint {self._on_conflict}")
+            inseridas.append(self._tabela.inserir(linha))
+        return inseridas
+
+    def _executar_select(self):
+        tabela = self._tabela
+        inicio = bisect.bisect_right(tabela.ids, self._id_minimo) if self._id_minimo is not None else 0
+        limite = bisect.bisect_left(tabela.ids, self._id_limite) if self._id_limite is not None else len(tabela.ids)
+        por_id = self._ordem in (None, ("id", False))
+        deslocamento, quantidade = 0, self._limite
+        if self._intervalo:
+            deslocamento = self._intervalo[0]
+            quantidade = self._intervalo[1] - self._intervalo[0] + 1
+
+        if por_id and self._count is None and not self._filtros:
+            # caminho rápido: fatia direta em ordem de id
+            fim = limite if quantidade is None else min(limite, inicio + deslocamento + quantidade)
+            linhas = tabela.linhas[inicio + deslocamento:fim]
+            total = None
+        else:
+            if self._iguais:
+                candidatas = tabela.indice(self._iguais[0][0]).get(self._iguais[0][1], [])
+                if self._id_minimo is not None:
+                    candidatas = [r for r in candidatas if r["id"] > self._id_minimo]
+                if self._id_limite is not None:
+                    candidatas = [r for r in candidatas if r["id"] < self._id_limite]
+            else:
+                candidatas = tabela.linhas[inicio:limite]
+            linhas = [r for r in candidatas if all(f(r) for f in self._filtros)]
+            if not por_id:
+                coluna, desc = self._ordem
+                linhas.sort(key=lambda r: (r.get(coluna) is None, r.get(coluna)), reverse=desc)
+            total = len(linhas) if self._count else None
+            linhas = linhas[deslocamento:None if quantidade is None else deslocamento + quantidade]
+
+        if self._colunas:
+            linhas = [{c: r.get(c) for c in self._colunas} for r in linhas]
+        else:
+            linhas = [dict(r) for r in linhas]
+        return RespostaFalsa(linhas, total)
+
+
+class StorageFalso:
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self.objetos = {}
+
+    def from_(self, bucket):
+        return self
+
+    def upload(self, caminho, dados, opcoes=None):
+        self._cliente.esperar()
+        self.objetos[caminho] = bytes(dados)
+
+    def download(self, caminho):
+        self._cliente.esperar()
+        return self.objetos[caminho]
+
+
+class SupabaseFalso:
+    """Dublê em memória do cliente do Supabase, com latência fixa por chamada."""
+
+    def __init__(self, latencia_seg=0.0):
+        self.latencia_seg = latencia_seg
+        self.tabelas = {}
+        self.chamadas = 0
+        self.storage = StorageFalso(self)
+
+    def esperar(self):
+        self.chamadas += 1
+        if self.latencia_seg:
+            time.sleep(self.latencia_seg)
+
+    def table(self, nome):
+        return ConsultaFalsa(self, nome)
+
+
+# =============================
+# Dados sintéticos
+# =============================
+def _iso_utc(dt):
+    return dt.astimezone(datetime.timezone.utc).isoformat()
+
+
+def gerar_apontamentos(cliente, n, dias=30, semente=1):
+    """n apontamentos espalhados pelos últimos `dias` dias (séries únicas por dia, ~1/dias deles hoje)."""
+    rnd = random.Random(semente)
+    tz = datetime.timezone(datetime.timedelta(hours=-3))
+    hoje = datetime.datetime.now(tz).replace(hour=6, minute=0, second=0, microsecond=0)
+    linhas = []
+    for i in range(n):
+        dia = hoje - datetime.timedelta(days=(dias - 1) - (i * dias // n))
+        data_hora = dia + datetime.timedelta(seconds=rnd.randrange(10 * 3600))
+        linhas.append(
+            {
+                "numero_serie": f"{100000000 + i:09d}",
+                "op": f"{rnd.randrange(10**10, 10**11)}",
+                "tipo_producao": rnd.choice(TIPOS),
+                "data_hora": _iso_utc(data_hora),
+                "dia_producao": data_hora.date().isoformat(),
+            }
+        )
+    linhas.sort(key=lambda r: r["data_hora"])
+    tabela = cliente.tabelas.setdefault("apontamentos", TabelaFalsa())
+    for linha in linhas:
+        tabela.inserir(linha)
+
+
+def gerar_checklists(cliente, n, semente=2, taxa_reprovacao=0.05, taxa_reinspecao=0.5):
+    """~n linhas de checklist (10 itens por série); parte reprovada e parte reinspecionada."""
+    rnd = random.Random(semente)
+    tabela = cliente.tabelas.setdefault("checklists", TabelaFalsa())
+    inicio = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
+    series = max(1, n // len(ITENS))
+    for i in range(series):
+        serie = f"{100000000 + i:09d}"
+        data_hora = inicio + datetime.timedelta(seconds=i * (30 * 86400 // series))
+        reprovado = rnd.random() < taxa_reprovacao
+        rodadas = [("Não", reprovado)]
+        if reprovado and rnd.random() < taxa_reinspecao:
+            rodadas.append(("Sim", False))
+        for reinspecao, reprovado_rodada in rodadas:
+            falha = rnd.choice(ITENS) if reprovado_rodada else None
+            for item in ITENS:
+                tabela.inserir(
+                    {
+                        "numero_serie": serie,
+                        "item": item,
+                        "status": "Não Conforme" if item == falha else "Conforme",
+                        "observacoes": rnd.choice(["Respingo", "Porosidade"]) if item == falha == "SOLDA" else "",
+                        "inspetor": rnd.choice(INSPETORES),
+                        "data_hora": _iso_utc(data_hora),
+                        "produto_reprovado": "Sim" if reprovado_rodada else "Não",
+                        "reinspecao": reinspecao,
+                        "foto_chave": None,
+                    }
+                )
+            data_hora += datetime.timedelta(hours=1)
+
+
+# =============================
+# Execução
+# =============================
+def importar_app(cliente, pasta_tmp):
+    """Importa o estudo4 apontando tudo para o dublê (nunca toca o Supabase real)."""
+    os.environ["SUPABASE_URL"] = "http://supabase-falso.local"
+    os.environ["SUPABASE_KEY"] = "bench.bench.bench"
+    os.environ["REALTIME_APONTAMENTOS"] = "0"
+    os.environ["FILA_APONTAMENTOS_DB"] = str(Path(pasta_tmp) / "fila.db")
+    os.environ["REPLICA_DB"] = str(Path(pasta_tmp) / "replica.db")
+    os.environ["FOTOS_BACKEND"] = "local"
+    os.environ["FOTOS_DIR"] = str(Path(pasta_tmp) / "fotos")
+
+    import supabase as supabase_lib
+
+    supabase_lib.create_client = lambda *args, **kwargs: cliente
+    sys.path.insert(0, str(Path(__file__).parent))
+    import estudo4
+
+    estudo4.supabase = cliente
+    return estudo4
+
+
+def limpar_caches(app):
+    """Zera os caches em memória e esvazia a réplica local (próxima sincronização é a carga inicial)."""
+    for cache in (app._cache_analise, app._cache_apontamentos):
+        cache.clear()
+    with app._REPLICA["lock"]:
+        for tabela in ("apontamentos", "checklists", "checklists_ultimo", "replica_marcas"):
+            app._REPLICA["con"].execute(f"DELETE FROM {tabela}")
+
+
+def cronometrar(funcao, repeticoes, preparar=None):
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return {
+        "mediana_ms": round(statistics.median(tempos) * 1000, 2),
+        "p95_ms": round(tempos[min(len(tempos) - 1, int(0.95 * len(tempos)))] * 1000, 2),
+    }
+
+
+def rodar(linhas, latencia_ms, repeticoes, pasta_tmp, app=None, cliente=None):
+    cliente = cliente or SupabaseFalso()
+    app = app or importar_app(cliente, pasta_tmp)
+    cliente.tabelas.clear()
+    cliente.latencia_seg = 0
+    gerar_apontamentos(cliente, linhas)
+    gerar_checklists(cliente, linhas)
+    cliente.latencia_seg = latencia_ms / 1000
+    limpar_caches(app)
+
+    contador = iter(range(10**8))
+    resultados_item = {item: {"status": "Conforme", "obs": ""} for item in ITENS}
+
+    def novo_checklist():
+        app.salvar_checklist(f"9{next(contador):08d}", resultados_item, "bench")
+
+    def novo_apontamento():
+        app.salvar_apontamento(f"8{next(contador):08d}", "12345678901", "Eixo")
+
+    def lote_apontamentos():
+        agora = datetime.datetime.now(app.TZ)
+        app.salvar_apontamentos_lote([(f"8{next(contador):08d}", "12345678901", "Eixo", agora) for _ in range(50)])
+
+    def sincronizar():
+        app.sincronizar_replica({"apontamentos": app._cache_apontamentos(), "analise": app._cache_analise()})
+
+    def menus():
+        app.codigos_para_inspecao()
+        app.numeros_serie_para_reinspecao()
+
+    def painel():
+        app.producao_por_hora("Eixo")
+        app.ultimos_apontamentos_do_dia("Eixo")
+
+    casos = {
+        "sincronizar_replica (frio)": (sincronizar, lambda: limpar_caches(app)),
+        "salvar_checklist": (novo_checklist, None),
+        "sincronizar_replica (delta)": (sincronizar, novo_checklist),
+        "salvar_apontamento": (novo_apontamento, None),
+        "salvar_apontamento (repetida)": (lambda: app.salvar_apontamento("877777777", "12345678901", "Eixo"), None),
+        "salvar_apontamentos_lote (50)": (lote_apontamentos, None),
+        "menus (Inspeção + Reinspeção, quente)": (menus, None),
+        "painel hora a hora + últimos 10": (painel, None),
+        "checklist_por_serie (quente)": (lambda: app.checklist_por_serie("100000000"), None),
+        "analise_periodo 30 dias (quente)": (lambda: app.analise_periodo(30), None),
+    }
+
+    # carrega a réplica e aquece os caches usados pelos casos "quentes"/"delta"
+    sincronizar()
+    app.analise_periodo(1)
+    app.salvar_apontamento("877777777", "12345678901", "Eixo")
+
+    saida = {}
+    for nome, (funcao, preparar) in casos.items():
+        chamadas = []
+
+        def executar_contando():
+            antes = cliente.chamadas
+            funcao()
+            chamadas.append(cliente.chamadas - antes)
+
+        medidas = cronometrar(executar_contando, repeticoes, preparar)
+        medidas["chamadas_por_execucao"] = round(sum(chamadas) / len(chamadas), 1)
+        saida[nome] = medidas
+        if "frio" in nome:
+            sincronizar()
+    return app, cliente, saida
+
+
+def imprimir(resultados, anterior=None):
+    for chave, casos in resultados.items():
+        print(f"\n== {chave} ==")
+        print(f"{'caso':42} {'mediana ms':>11} {'p95 ms':>9} {'chamadas':>9} {'vs anterior':>12}")
+        for nome, m in casos.items():
+            comparacao = ""
+            if anterior and nome in anterior.get(chave, {}):
+                antes = anterior[chave][nome]["mediana_ms"]
+                if antes:
+                    comparacao = f"{(m['mediana_ms'] - antes) / antes * 100:+.1f}%"
+            print(
+                f"{nome:42} {m['mediana_ms']:>11} {m['p95_ms']:>9} {m['chamadas_por_execucao']:>9} {comparacao:>12}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", default="10000", help="volumes de linhas separados por vírgula (ex.: 10000,1000000)")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latência simulada por chamada ao banco")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", help="grava os resultados neste arquivo")
+    parser.add_argument("--comparar", help="compara com um resultado anterior (arquivo JSON)")
+    args = parser.parse_args()
+
+    resultados = {}
+    app = cliente = None
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        for n in (int(x) for x in args.linhas.split(",")):
+            app, cliente, saida = rodar(n, args.latencia_ms, args.repeticoes, pasta_tmp, app, cliente)
+            resultados[f"{n} linhas, {args.latencia_ms:g} ms/chamada"] = saida
+
+    anterior = json.loads(Path(args.comparar).read_text()) if args.comparar else None
+    imprimir(resultados, anterior)
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
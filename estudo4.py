@@ -1,47 +1,224 @@
+import time
+
+_INICIO_SCRIPT = time.perf_counter()  # ✅ base dos tempos de import e primeira pintura de cada rerun
+
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
 import datetime
 import pytz
 import base64
+import hashlib
 from supabase import create_client
 import os
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
-import plotly.express as px
-import plotly.graph_objects as go
-import time
+import threading
+import sqlite3
+import contextlib
+import gzip
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # ✅ evita NameError no seu try/except do salvar_checklist
 try:
-    from supabase.lib.client_options import ClientOptions  # noqa: F401
     from postgrest.exceptions import APIError
 except Exception:
     APIError = Exception  # fallback para não quebrar
 
+try:
+    from supabase import ClientOptions  # opções do cliente síncrono (a classe base não tem .storage)
+except Exception:
+    ClientOptions = None
+
+_FIM_IMPORTS = time.perf_counter()
+
 # ==============================
 # ✅ PAGE CONFIG (TEM QUE SER A PRIMEIRA CHAMADA STREAMLIT)
 # ==============================
 st.set_page_config(page_title="Controle de Qualidade", layout="wide")
 
 # ================================
-# Verificação do autorefresh
+# Fragments (reexecuta só um trecho da página)
 # ================================
-try:
-    from streamlit_autorefresh import st_autorefresh
-    AUTORELOAD_AVAILABLE = True
-except ImportError:
-    AUTORELOAD_AVAILABLE = False
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+# =============================
+# Métricas de desempenho (latência por chamada)
+# =============================
+METRICAS_JANELA = 2000  # últimas N amostras por nome de chamada
+METRICAS_PORTA = os.getenv("METRICS_PORT")  # se definido, expõe /metrics (formato Prometheus)
+
+
+@st.cache_resource(show_spinner=False)
+def _metricas():
+    """Amostras de duração por nome de chamada, compartilhadas pelo processo (inclusive threads)."""
+    return {"amostras": {}, "totais": {}, "estruturas": {}, "lock": threading.Lock()}
+
+
+# resolvido na thread do script: as threads de fundo usam esta mesma referência
+_METRICAS = _metricas()
+
+
+def _registrar_metrica(nome, duracao, linhas=0, n_bytes=0, erro=False):
+    with _METRICAS["lock"]:
+        amostras = _METRICAS["amostras"].setdefault(nome, deque(maxlen=METRICAS_JANELA))
+        amostras.append(duracao)
+        totais = _METRICAS["totais"].setdefault(
+            nome, {"chamadas": 0, "erros": 0, "linhas": 0, "bytes": 0, "segundos": 0.0}
+        )
+        totais["chamadas"] += 1
+        totais["erros"] += int(erro)
+        totais["linhas"] += linhas
+        totais["bytes"] += n_bytes
+        totais["segundos"] += duracao
+
+
+@contextlib.contextmanager
+def medir(nome):
+    """Mede o bloco (ou a função, usado como decorator); o bloco pode preencher m["linhas"] e m["bytes"]."""
+    m = {"linhas": 0, "bytes": 0}
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield m
+    except Exception:
+        erro = True
+        raise
+    finally:
+        _registrar_metrica(nome, time.perf_counter() - inicio, m["linhas"], m["bytes"], erro)
+
+
+def executar(nome, consulta):
+    """consulta.execute() medido: duração e linhas da resposta.
+
+    Bytes só entram onde saem de graça (fotos); reserializar o JSON de cada
+    resposta só para medir custaria CPU justamente nas cargas medidas.
+    """
+    with medir(nome) as m:
+        resp = consulta.execute()
+        if isinstance(resp.data, list):
+            m["linhas"] = len(resp.data)
+    return resp
+
+
+def _percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+def resumo_metricas():
+    """Uma linha por chamada: totais + p50/p95/p99 (ms) da janela recente."""
+    with _METRICAS["lock"]:
+        copia = {nome: (sorted(a), dict(_METRICAS["totais"][nome])) for nome, a in _METRICAS["amostras"].items()}
+    linhas = []
+    for nome, (ordenadas, totais) in sorted(copia.items()):
+        linhas.append(
+            {
+                "chamada": nome,
+                **totais,
+                "p50_ms": round(_percentil(ordenadas, 50) * 1000, 1),
+                "p95_ms": round(_percentil(ordenadas, 95) * 1000, 1),
+                "p99_ms": round(_percentil(ordenadas, 99) * 1000, 1),
+            }
+        )
+    return linhas
+
+
+def metricas_prometheus():
+    """Métricas no formato texto do Prometheus (quantis da janela recente + contadores)."""
+    saida = [
+        "# TYPE app_chamada_segundos summary",
+        "# TYPE app_chamada_linhas_total counter",
+        "# TYPE app_chamada_bytes_total counter",
+        "# TYPE app_chamada_erros_total counter",
+    ]
+    for r in resumo_metricas():
+        rotulo = f'chamada="{r["chamada"]}"'
+        for q, campo in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+            saida.append(f'app_chamada_segundos{{{rotulo},quantile="{q}"}} {r[campo] / 1000}')
+        saida.append(f"app_chamada_segundos_sum{{{rotulo}}} {r['segundos']}")
+        saida.append(f"app_chamada_segundos_count{{{rotulo}}} {r['chamadas']}")
+        saida.append(f"app_chamada_linhas_total{{{rotulo}}} {r['linhas']}")
+        saida.append(f"app_chamada_bytes_total{{{rotulo}}} {r['bytes']}")
+        saida.append(f"app_chamada_erros_total{{{rotulo}}} {r['erros']}")
+    saida.append("# TYPE app_memoria_bytes gauge")
+    for nome, n_bytes in memoria_estruturas().items():
+        saida.append(f'app_memoria_bytes{{estrutura="{nome}"}} {n_bytes}')
+    return "\n".join(saida) + "\n"
+
+
+@st.cache_resource(show_spinner=False)
+def _servidor_metricas(porta):
+    """Servidor HTTP mínimo (thread própria) que responde as métricas para scraping."""
+    from wsgiref.simple_server import make_server
+
+    def app_metricas(environ, start_response):
+        corpo = metricas_prometheus().encode()
+        start_response("200 OK", [("Content-Type", "text/plain; version=0.0.4"), ("Content-Length", str(len(corpo)))])
+        return [corpo]
+
+    servidor = make_server("", int(porta), app_metricas)
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    return servidor
+
+
+@st.cache_resource(show_spinner=False)
+def _inicio_frio():
+    """Tempos da primeira execução do processo (imports a frio e primeira pintura)."""
+    _registrar_metrica("inicio_frio.imports", _FIM_IMPORTS - _INICIO_SCRIPT)
+    return {"imports": _FIM_IMPORTS - _INICIO_SCRIPT, "primeira_pintura": None}
+
+
+_registrar_metrica("script.imports", _FIM_IMPORTS - _INICIO_SCRIPT)
+_inicio_frio()
+
+
+def registrar_primeira_pintura():
+    """Chamar quando a página já tem conteúdo na tela (mede desde o início do rerun)."""
+    duracao = time.perf_counter() - _INICIO_SCRIPT
+    _registrar_metrica("script.primeira_pintura", duracao)
+    frio = _inicio_frio()
+    if frio["primeira_pintura"] is None:
+        frio["primeira_pintura"] = duracao
+        _registrar_metrica("inicio_frio.primeira_pintura", duracao)
+
 
 # =============================
-# Carregar variáveis de ambiente
+# Carregar variáveis de ambiente (uma vez por processo)
 # =============================
 env_path = Path(__file__).parent / "teste.env"  # Ajuste se necessário
-load_dotenv(dotenv_path=env_path)
+
+
+@st.cache_resource(show_spinner=False)
+def _carregar_env():
+    load_dotenv(dotenv_path=env_path)
+    return True
+
+
+_carregar_env()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+SUPABASE_TIMEOUT_SEG = int(os.getenv("SUPABASE_TIMEOUT_SEG", "15"))
+
+
+@st.cache_resource(show_spinner=False)
+def get_supabase():
+    """Cliente Supabase único do processo, reaproveitado por reruns, sessões e threads.
+
+    As sessões HTTP (httpx) do PostgREST e do Storage ficam abertas entre as
+    chamadas: keep-alive e pool de conexões (até 20 ociosas, acima de
+    SUPABASE_CONCORRENCIA), com timeout explícito em cada requisição.
+    """
+    if ClientOptions is None:
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
+    opcoes = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SEG, storage_client_timeout=SUPABASE_TIMEOUT_SEG)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=opcoes)
+
+
+supabase = get_supabase()
 
 # =============================
 # Configurações iniciais
@@ -50,37 +227,673 @@ TZ = pytz.timezone("America/Sao_Paulo")
 itens = ["Etiqueta", "Tambor + Parafuso", "Solda", "Pintura", "Borracha ABS"]
 usuarios = {"admin": "admin", "Maria": "maria", "Catia": "catia", "Vera": "vera", "Bruno": "bruno"}
 
+# =============================
+# Frames compactos (tipos por coluna) e memória das estruturas do processo
+# =============================
+# category: valores repetidos (itens, status, inspetor...); sim_nao: "Sim"/"Não" vira bool;
+# colunas fora do esquema (ex.: miniatura da foto em base64) não entram no frame
+ESQUEMA_FRAMES = {
+    "checklists": {
+        "id": "int64",
+        "numero_serie": "category",  # ~10 linhas (itens) por série
+        "item": "category",
+        "status": "category",
+        "observacoes": "category",
+        "inspetor": "category",
+        "data_hora": "data_hora",
+        "produto_reprovado": "sim_nao",
+        "reinspecao": "sim_nao",
+    },
+}
+
+
+def tipar_frame(linhas, tabela):
+    """DataFrame compacto das linhas do banco: só as colunas do esquema, já tipadas."""
+    esquema = ESQUEMA_FRAMES[tabela]
+    df = pd.DataFrame(linhas)
+    df = df.reindex(columns=[c for c in esquema if c in df.columns])
+    for coluna in df.columns:
+        tipo = esquema[coluna]
+        if tipo == "data_hora":
+            df[coluna] = pd.to_datetime(df[coluna], errors="coerce", utc=True).dt.tz_convert(TZ)
+        elif tipo == "sim_nao":
+            df[coluna] = df[coluna] == "Sim"
+        else:
+            df[coluna] = df[coluna].astype(tipo)
+    return df
+
+
+def registrar_estrutura(nome, dono, chave):
+    """Inclui dono[chave] no relatório de memória (medido com dono["lock"]); chamar da thread do script."""
+    with _METRICAS["lock"]:
+        _METRICAS["estruturas"][nome] = (dono, chave)
+
+
+def _tamanho_profundo(obj):
+    """Bytes aproximados do objeto e de tudo que ele referencia (dicts, listas, sets, tuplas)."""
+    vistos, pilha, total = set(), [obj], 0
+    while pilha:
+        o = pilha.pop()
+        if id(o) in vistos:
+            continue
+        vistos.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            pilha.extend(o.keys())
+            pilha.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            pilha.extend(o)
+    return total
+
+
+def memoria_estruturas():
+    """Bytes de cada estrutura registrada em memória + tamanho do arquivo da réplica (Diagnóstico e /metrics)."""
+    with _METRICAS["lock"]:
+        estruturas = dict(_METRICAS["estruturas"])
+    tamanhos = {}
+    for nome, (dono, chave) in estruturas.items():
+        with dono["lock"]:
+            tamanhos[nome] = _tamanho_profundo(dono[chave])
+    with contextlib.suppress(OSError):
+        tamanhos["replica_db"] = sum(
+            arquivo.stat().st_size for arquivo in REPLICA_DB.parent.glob(REPLICA_DB.name + "*")
+        )
+    return tamanhos
+
+
 # =============================
 # Funções do Supabase
 # =============================
-def carregar_checklists():
-    """Carrega todos os checklists do Supabase, sem limite de 1000 linhas."""
-    data_total = []
-    inicio = 0
-    passo = 1000
+CHECKLISTS_PASSO = 1000
+# Sem as colunas de foto: a imagem fica no blob store e a miniatura só é lida sob demanda
+COLUNAS_CHECKLISTS = (
+    "id,numero_serie,item,status,observacoes,inspetor,data_hora,produto_reprovado,reinspecao,foto_chave"
+)
 
+
+def _buscar_novas_linhas(tabela, colunas="*", ultimo_id=None, passo=CHECKLISTS_PASSO, ate_id=None):
+    """Busca (paginado por id) as linhas com id maior que ultimo_id (e menor que ate_id); None busca tudo."""
+    linhas = []
     while True:
-        response = supabase.table("checklists").select("*").range(inicio, inicio + passo - 1).execute()
-        dados = response.data
-        if not dados:
+        consulta = supabase.table(tabela).select(colunas).order("id")
+        if ultimo_id is not None:
+            consulta = consulta.gt("id", ultimo_id)
+        if ate_id is not None:
+            consulta = consulta.lt("id", ate_id)
+        dados = executar(f"{tabela}.delta", consulta.limit(passo)).data or []
+        linhas.extend(dados)
+        if len(dados) < passo:
             break
-        data_total.extend(dados)
-        inicio += passo
+        ultimo_id = dados[-1]["id"]
+    return linhas
 
-    df = pd.DataFrame(data_total)
 
-    if not df.empty and "data_hora" in df.columns:
-        df["data_hora"] = pd.to_datetime(df["data_hora"], utc=True).dt.tz_convert(TZ)
+# máximo de faixas de id buscadas ao mesmo tempo numa carga completa
+SUPABASE_CONCORRENCIA = int(os.getenv("SUPABASE_CONCORRENCIA", "8"))
+
+
+def _id_extremo(tabela, desc):
+    consulta = supabase.table(tabela).select("id").order("id", desc=desc).limit(1)
+    dados = executar(f"{tabela}.extremo", consulta).data or []
+    return dados[0]["id"] if dados else None
+
+
+def _buscar_todas_linhas(tabela, colunas="*", passo=CHECKLISTS_PASSO, concorrencia=SUPABASE_CONCORRENCIA):
+    """Carga completa: divide [menor id, maior id] em faixas buscadas em paralelo (no máximo `concorrencia`).
+
+    Dentro de cada faixa a paginação é por chave (id > último recebido), nunca por
+    OFFSET: exclusões durante a carga não pulam linhas e cada página custa o mesmo.
+    As linhas inseridas depois vêm num último delta a partir do maior id.
+    """
+    menor, maior = _id_extremo(tabela, desc=False), _id_extremo(tabela, desc=True)
+    if menor is None:
+        return _buscar_novas_linhas(tabela, colunas, passo=passo)
+
+    n_faixas = max(1, min(concorrencia * 4, (maior - menor) // passo + 1))
+    largura = (maior - menor) // n_faixas + 1
+    inicios = [menor + i * largura for i in range(n_faixas)]
+
+    def faixa(inicio):
+        return _buscar_novas_linhas(tabela, colunas, inicio - 1, passo, ate_id=min(inicio + largura, maior + 1))
+
+    linhas = []
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia), thread_name_prefix=f"carga-{tabela}") as pool:
+        for dados in pool.map(faixa, inicios):
+            linhas.extend(dados)
+    # o que entrou depois da leitura do maior id
+    return linhas + _buscar_novas_linhas(tabela, colunas, maior, passo)
+
+
+# =============================
+# Réplica local (SQLite) para leitura
+# =============================
+# Todas as telas leem daqui com SQL. A thread do hub traz do Supabase as linhas
+# com id acima da marca de cada tabela; os inserts desta instância entram na hora.
+REPLICA_DB = Path(os.getenv("REPLICA_DB", Path(__file__).parent / "replica.db"))
+# ids de sequência confirmam fora de ordem com várias estações gravando: cada delta relê os
+# últimos REPLICA_JANELA_IDS ids abaixo da marca (o INSERT OR IGNORE descarta o que já existe)
+REPLICA_JANELA_IDS = int(os.getenv("REPLICA_JANELA_IDS", "200"))
+REPLICA_COLUNAS = {
+    "apontamentos": "id,numero_serie,op,tipo_producao,data_hora,dia_producao",
+    "checklists": COLUNAS_CHECKLISTS,
+}
+
+
+def _replica_conectar():
+    REPLICA_DB.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(REPLICA_DB, check_same_thread=False, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")  # réplica: o que se perder numa queda volta pelo delta
+    con.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS apontamentos (
+            id INTEGER PRIMARY KEY,
+            numero_serie TEXT NOT NULL,
+            op TEXT,
+            tipo_producao TEXT COLLATE NOCASE,
+            data_hora TEXT,
+            dia TEXT,
+            hora INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS apontamentos_serie ON apontamentos (numero_serie);
+        CREATE INDEX IF NOT EXISTS apontamentos_data_hora ON apontamentos (data_hora);
+        CREATE INDEX IF NOT EXISTS apontamentos_dia_tipo ON apontamentos (dia, tipo_producao);
+
+        CREATE TABLE IF NOT EXISTS checklists (
+            id INTEGER PRIMARY KEY,
+            numero_serie TEXT NOT NULL,
+            item TEXT,
+            status TEXT,
+            observacoes TEXT,
+            inspetor TEXT,
+            data_hora TEXT,
+            produto_reprovado TEXT,
+            reinspecao TEXT,
+            foto_chave TEXT
+        );
+        CREATE INDEX IF NOT EXISTS checklists_serie ON checklists (numero_serie, id);
+        CREATE INDEX IF NOT EXISTS checklists_data_hora ON checklists (data_hora);
+
+        -- último checklist de cada série (as linhas de um checklist têm a mesma data_hora)
+        CREATE TABLE IF NOT EXISTS checklists_ultimo (
+            numero_serie TEXT PRIMARY KEY,
+            ultimo_id INTEGER NOT NULL,
+            data_hora TEXT,
+            reprovado INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS checklists_ultimo_reprovados ON checklists_ultimo (data_hora) WHERE reprovado = 1;
+
+        CREATE TABLE IF NOT EXISTS replica_marcas (tabela TEXT PRIMARY KEY, ultimo_id INTEGER);
+        """
+    )
+    # réplica criada antes da tabela de resumo: monta o resumo uma vez a partir das linhas
+    if con.execute("SELECT 1 FROM checklists_ultimo LIMIT 1").fetchone() is None:
+        con.execute(
+            "INSERT INTO checklists_ultimo (numero_serie, ultimo_id, data_hora, reprovado) "
+            "SELECT numero_serie, MAX(id), data_hora, produto_reprovado = 'Sim' FROM checklists GROUP BY numero_serie"
+        )
+    return con
+
+
+@st.cache_resource
+def _replica():
+    """Réplica do processo: uma conexão (protegida por lock) + lock da sincronização."""
+    return {"con": _replica_conectar(), "lock": threading.Lock(), "sync_lock": threading.Lock()}
+
+
+# resolvido na thread do script: as threads de fundo usam esta mesma referência
+_REPLICA = _replica()
+
+
+def _hora_local(data_hora):
+    """data_hora do banco (ISO, UTC) -> datetime em São Paulo."""
+    valor = datetime.datetime.fromisoformat(str(data_hora).replace("Z", "+00:00"))
+    if valor.tzinfo is None:
+        valor = pytz.UTC.localize(valor)
+    return valor.astimezone(TZ)
+
+
+def replica_consultar(sql, parametros=()):
+    """SELECT na réplica; devolve as linhas (sqlite3.Row)."""
+    with _REPLICA["lock"]:
+        return _REPLICA["con"].execute(sql, parametros).fetchall()
+
+
+def replica_gravar(tabela, linhas, substituir=False):
+    """Grava linhas vindas do banco na réplica (idempotente por id); devolve quantas eram novas.
+
+    substituir=True troca a tabela inteira (e a marca d'água) numa transação só:
+    quem lê no meio vê a versão antiga, nunca a tabela vazia.
+    """
+    if not linhas and not substituir:
+        return 0
+    if tabela == "apontamentos":
+        registros = []
+        for r in linhas:
+            local = _hora_local(r["data_hora"])
+            registros.append(
+                (
+                    r["id"],
+                    r["numero_serie"],
+                    r.get("op"),
+                    r.get("tipo_producao"),
+                    local.astimezone(pytz.UTC).isoformat(timespec="microseconds"),  # formato único: ordena como texto
+                    str(r.get("dia_producao") or local.date().isoformat()),
+                    local.hour,
+                )
+            )
+        sql = (
+            "INSERT OR IGNORE INTO apontamentos (id, numero_serie, op, tipo_producao, data_hora, dia, hora) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)"
+        )
+    else:
+        colunas = COLUNAS_CHECKLISTS.split(",")
+        registros = [tuple(r.get(c) for c in colunas) for r in linhas]
+        sql = f"INSERT OR IGNORE INTO checklists ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+
+    with _REPLICA["lock"]:
+        con = _REPLICA["con"]
+        antes = con.total_changes
+        with con:
+            con.execute("BEGIN")
+            if substituir:
+                con.execute(f"DELETE FROM {tabela}")
+                if tabela == "checklists":
+                    con.execute("DELETE FROM checklists_ultimo")
+                con.execute(
+                    "INSERT OR REPLACE INTO replica_marcas (tabela, ultimo_id) VALUES (?, ?)",
+                    (tabela, max((r["id"] for r in linhas), default=0)),
+                )
+                antes = con.total_changes
+            con.executemany(sql, registros)
+            novos = con.total_changes - antes
+            if tabela == "checklists":
+                _resumo_ultimo_checklist(con, linhas)
+        return novos
+
+
+def _resumo_ultimo_checklist(con, linhas):
+    """Atualiza o último checklist de cada série com as linhas novas (só avança: id maior vence)."""
+    ultimas = {}
+    for r in linhas:
+        if r["id"] > ultimas.get(r["numero_serie"], {"id": -1})["id"]:
+            ultimas[r["numero_serie"]] = r
+    con.executemany(
+        """
+        INSERT INTO checklists_ultimo (numero_serie, ultimo_id, data_hora, reprovado) VALUES (?, ?, ?, ?)
+        ON CONFLICT (numero_serie) DO UPDATE SET
+            ultimo_id = excluded.ultimo_id, data_hora = excluded.data_hora, reprovado = excluded.reprovado
+        WHERE excluded.ultimo_id > checklists_ultimo.ultimo_id
+        """,
+        [(r["numero_serie"], r["id"], r["data_hora"], r["produto_reprovado"] == "Sim") for r in ultimas.values()],
+    )
+
+
+def _replica_marca(tabela):
+    linha = replica_consultar("SELECT ultimo_id FROM replica_marcas WHERE tabela = ?", (tabela,))
+    return linha[0]["ultimo_id"] if linha else None
+
+
+def _replica_sincronizar(tabela, gravar=None, resync=False):
+    """Traz para a réplica as linhas com id acima da marca (a tabela inteira na primeira vez ou em resync).
+
+    gravar(linhas) grava as linhas (padrão: replica_gravar; precisa ser idempotente por id,
+    porque o delta relê uma janela abaixo da marca); a marca só anda depois.
+    Em resync a tabela é baixada inteira antes e trocada numa transação só.
+    """
+    gravar = gravar or (lambda linhas: replica_gravar(tabela, linhas))
+    with _REPLICA["sync_lock"]:
+        colunas = REPLICA_COLUNAS[tabela]
+        if resync:
+            linhas = _buscar_todas_linhas(tabela, colunas)
+            replica_gravar(tabela, linhas, substituir=True)
+            return linhas
+        ultimo_id = _replica_marca(tabela)
+        if ultimo_id is None:
+            linhas = _buscar_todas_linhas(tabela, colunas)
+        else:
+            linhas = _buscar_novas_linhas(tabela, colunas, max(0, ultimo_id - REPLICA_JANELA_IDS))
+        gravar(linhas)
+        novo_id = max((r["id"] for r in linhas), default=0)
+        if ultimo_id is None or novo_id > ultimo_id:
+            novo_id = max(novo_id, ultimo_id or 0)
+            with _REPLICA["lock"]:
+                _REPLICA["con"].execute(
+                    "INSERT OR REPLACE INTO replica_marcas (tabela, ultimo_id) VALUES (?, ?)", (tabela, novo_id)
+                )
+    return linhas
+
+
+def status_replica():
+    """Linhas e marca d'água de cada tabela da réplica (Diagnóstico)."""
+    return {
+        tabela: {
+            "linhas": replica_consultar(f"SELECT COUNT(*) FROM {tabela}")[0][0],
+            "ultimo_id": _replica_marca(tabela),
+        }
+        for tabela in REPLICA_COLUNAS
+    }
+
+
+def checklist_por_serie(numero_serie):
+    """Última resposta de cada item do Nº de Série ({"itens": {item: {"status", "obs"}}, ...}) ou None.
+
+    Uma consulta por chave na réplica (índice por série); as linhas vêm em ordem
+    de id, então a resposta mais nova de cada item é a que fica.
+    """
+    linhas = replica_consultar(
+        "SELECT id, item, status, observacoes, data_hora FROM checklists WHERE numero_serie = ? ORDER BY id",
+        (numero_serie,),
+    )
+    if not linhas:
+        return None
+    return {
+        "itens": {r["item"]: {"status": r["status"], "obs": r["observacoes"]} for r in linhas},
+        "ultimo_id": linhas[-1]["id"],
+        "data_hora": linhas[-1]["data_hora"],
+    }
+
+
+def checklists_anexar(linhas):
+    """Escrita direta das linhas recém-gravadas na réplica e nos agregados da análise (a marca d'água não muda)."""
+    replica_gravar("checklists", linhas)
+    analise_anexar(_cache_analise(), linhas)
+
+
+# =============================
+# Análise de qualidade (agregados diários)
+# =============================
+COLUNAS_ANALISE = "id,numero_serie,item,status,observacoes,inspetor,data_hora,produto_reprovado,reinspecao"
+ANALISE_DIAS_MAX = 365  # maior período da página: dias mais antigos saem da memória
+
+
+@st.cache_resource
+def _cache_analise():
+    """Agregados por dia dos checklists; as linhas novas são somadas, o histórico nunca é relido."""
+    return {"dias": {}, "carregado": False, "lock": threading.Lock()}
+
+
+def _agregado_dia(estado, dia):
+    return estado["dias"].setdefault(
+        dia,
+        {
+            "itens": {},  # item -> [verificados, não conformes]
+            "defeitos": {},  # (item, observação) -> não conformes
+            "inspetores": {},  # (inspetor, hora) -> checklists
+            "inspecoes": 0,
+            "aprovadas": 0,  # aprovadas de primeira
+            "reinspecoes": 0,
+            "checklists": set(),  # chaves dos checklists já contados no dia
+            "ids": set(),  # ids das linhas já somadas no dia
+        },
+    )
+
+
+def _analise_podar(estado):
+    """Descarta os dias fora do maior período (agregados e chaves juntos)."""
+    corte = datetime.datetime.now(TZ).date() - datetime.timedelta(days=ANALISE_DIAS_MAX)
+    for dia in [d for d in estado["dias"] if d < corte]:
+        del estado["dias"][dia]
+    return corte
+
+
+def _analise_incorporar(estado, linhas, substituir=False):
+    """Soma as linhas nos agregados do dia (idempotente por id: a escrita direta e o delta podem se repetir)."""
+    if substituir:
+        estado["dias"] = {}
+    corte = _analise_podar(estado)
+    if not linhas:
+        return
+    df = tipar_frame(linhas, "checklists")
+    df["dia"] = df["data_hora"].dt.date
+    df = df[df["dia"] >= corte]
+    ja_somadas = [i in estado["dias"].get(d, {}).get("ids", ()) for i, d in zip(df["id"], df["dia"])]
+    df = df[[not j for j in ja_somadas]].copy()
+    if df.empty:
+        return
+    for dia, ids in df.groupby("dia")["id"]:
+        _agregado_dia(estado, dia)["ids"].update(ids.tolist())
+    df["nc"] = df["status"] == "Não Conforme"
+
+    itens = df.groupby(["dia", "item"], observed=True)["nc"].agg(["size", "sum"])
+    for (dia, item), n, n_nc in zip(itens.index, itens["size"], itens["sum"]):
+        atual = _agregado_dia(estado, dia)["itens"].setdefault(item, [0, 0])
+        atual[0] += int(n)
+        atual[1] += int(n_nc)
+
+    defeitos = df[df["nc"] & df["observacoes"].notna()].groupby(["dia", "item", "observacoes"], observed=True).size()
+    for (dia, item, obs), n in defeitos.items():
+        if obs:
+            chave = (item, obs)
+            agregado = _agregado_dia(estado, dia)["defeitos"]
+            agregado[chave] = agregado.get(chave, 0) + int(n)
+
+    # um checklist = as linhas gravadas juntas (mesma série, data/hora e tipo); podem vir em páginas diferentes
+    for r in df.drop_duplicates(["numero_serie", "data_hora", "reinspecao"]).itertuples(index=False):
+        chave = (r.numero_serie, r.data_hora, r.reinspecao)
+        agregado = _agregado_dia(estado, r.dia)
+        if chave in agregado["checklists"]:
+            continue
+        agregado["checklists"].add(chave)
+        if r.reinspecao:
+            agregado["reinspecoes"] += 1
+        else:
+            agregado["inspecoes"] += 1
+            agregado["aprovadas"] += not r.produto_reprovado
+        chave_inspetor = (r.inspetor, r.data_hora.hour)
+        agregado["inspetores"][chave_inspetor] = agregado["inspetores"].get(chave_inspetor, 0) + 1
 
-    return df
 
+def _analise_carregar(estado):
+    """Monta os agregados a partir de todos os checklists da réplica (primeira abertura ou resync)."""
+    with estado["lock"]:
+        linhas = [dict(r) for r in replica_consultar(f"SELECT {COLUNAS_ANALISE} FROM checklists ORDER BY id")]
+        _analise_incorporar(estado, linhas, substituir=True)
+        estado["carregado"] = True
 
+
+def analise_anexar(estado, linhas):
+    """Soma as linhas recém-gravadas na réplica (delta do hub ou escrita direta); nada a fazer antes da carga.
+
+    Alimentado pelas linhas que chegam à réplica, e não por uma marca d'água de
+    id: linhas de outras estações com id menor que as desta sessão ainda contam.
+    """
+    with estado["lock"]:
+        if estado["carregado"]:
+            _analise_incorporar(estado, linhas)
+
+
+@medir("carregar_analise")
+def analise_periodo(n_dias, resync=False):
+    """Agregados dos últimos n_dias (custo proporcional ao período, não ao histórico)."""
+    estado = _cache_analise()
+    if resync or not estado["carregado"]:
+        _analise_carregar(estado)
+
+    hoje = datetime.datetime.now(TZ).date()
+    itens, defeitos, inspetores, ritmo, tendencia = {}, {}, {}, {}, []
+    with estado["lock"]:
+        for i in range(n_dias - 1, -1, -1):
+            dia = hoje - datetime.timedelta(days=i)
+            agregado = estado["dias"].get(dia)
+            if agregado is None:
+                continue
+            for item, (n, n_nc) in agregado["itens"].items():
+                atual = itens.setdefault(item, [0, 0])
+                atual[0] += n
+                atual[1] += n_nc
+            for chave, n in agregado["defeitos"].items():
+                defeitos[chave] = defeitos.get(chave, 0) + n
+            for chave, n in agregado["inspetores"].items():
+                inspetores[chave] = inspetores.get(chave, 0) + n
+                atual = ritmo.setdefault(chave[0], [0, 0])  # [checklists, horas trabalhadas]
+                atual[0] += n
+                atual[1] += 1
+            tendencia.append(
+                {
+                    "dia": dia,
+                    "inspecoes": agregado["inspecoes"],
+                    "aprovadas": agregado["aprovadas"],
+                    "reinspecoes": agregado["reinspecoes"],
+                }
+            )
+
+    return {
+        "itens": pd.DataFrame(
+            [{"item": k, "verificados": n, "nao_conformes": n_nc} for k, (n, n_nc) in itens.items()],
+            columns=["item", "verificados", "nao_conformes"],
+        ),
+        "defeitos": pd.DataFrame(
+            [{"item": item, "defeito": obs, "ocorrencias": n} for (item, obs), n in defeitos.items()],
+            columns=["item", "defeito", "ocorrencias"],
+        ),
+        "inspetores": pd.DataFrame(
+            [{"inspetor": insp, "hora": hora, "checklists": n} for (insp, hora), n in inspetores.items()],
+            columns=["inspetor", "hora", "checklists"],
+        ),
+        "ritmo": pd.DataFrame(
+            [{"inspetor": insp, "checklists": n, "por_hora": round(n / horas, 1)} for insp, (n, horas) in ritmo.items()],
+            columns=["inspetor", "checklists", "por_hora"],
+        ),
+        "tendencia": pd.DataFrame(tendencia, columns=["dia", "inspecoes", "aprovadas", "reinspecoes"]),
+    }
+
+
+# =============================
+# Fotos da etiqueta (blob store)
+# =============================
+# "supabase" (Supabase Storage, produção) ou "local" (pasta no disco, testes)
+FOTOS_BACKEND = os.getenv("FOTOS_BACKEND", "supabase")
+FOTOS_BUCKET = os.getenv("FOTOS_BUCKET", "fotos-etiqueta")
+FOTOS_DIR = Path(os.getenv("FOTOS_DIR", Path(__file__).parent / "fotos_etiqueta"))
+MINIATURA_LADO = 160
+
+
+def _blob_gravar(chave, dados, content_type="image/jpeg"):
+    if FOTOS_BACKEND == "local":
+        destino = FOTOS_DIR / chave
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_bytes(dados)
+    else:
+        with medir("fotos.upload") as m:
+            supabase.storage.from_(FOTOS_BUCKET).upload(
+                chave, dados, {"content-type": content_type, "upsert": "true"}
+            )
+            m["bytes"] = len(dados)
+
+
+def _blob_apagar(chave):
+    if FOTOS_BACKEND == "local":
+        (FOTOS_DIR / chave).unlink(missing_ok=True)
+    else:
+        with medir("fotos.remover"):
+            supabase.storage.from_(FOTOS_BUCKET).remove([chave])
+
+
+def _blob_ler(chave):
+    if FOTOS_BACKEND == "local":
+        return (FOTOS_DIR / chave).read_bytes()
+    with medir("fotos.download") as m:
+        dados = supabase.storage.from_(FOTOS_BUCKET).download(chave)
+        m["bytes"] = len(dados)
+    return dados
+
+
+def _gerar_miniatura(foto_bytes, lado=MINIATURA_LADO):
+    """Miniatura JPEG em base64 (None se o OpenCV não estiver disponível ou a imagem for inválida)."""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return None
+
+    img = cv2.imdecode(np.frombuffer(foto_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    escala = lado / max(h, w)
+    if escala < 1:
+        img = cv2.resize(img, (max(1, int(w * escala)), max(1, int(h * escala))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return base64.b64encode(buf.tobytes()).decode() if ok else None
+
+
+def salvar_foto_etiqueta(serie, foto_bytes, content_type="image/jpeg"):
+    """Grava a foto no blob store e devolve os campos que vão na linha do checklist."""
+    sha = hashlib.sha256(foto_bytes).hexdigest()
+    chave = f"{serie}/{sha}"
+    _blob_gravar(chave, foto_bytes, content_type)
+    return {
+        "foto_chave": chave,
+        "foto_tamanho": len(foto_bytes),
+        "foto_sha256": sha,
+        "foto_miniatura": _gerar_miniatura(foto_bytes),
+    }
+
+
+def descartar_foto_etiqueta(chave):
+    """Remove a foto de um checklist que não foi gravado, se nenhuma linha aponta para ela.
+
+    A chave é série + hash: uma reinspeção com a mesma foto reaproveita o blob do
+    checklist original, então só apaga com a confirmação do banco de que está órfão.
+    """
+    with contextlib.suppress(Exception):  # na dúvida (sem conexão) o blob fica
+        referencias = executar(
+            "checklists.foto_referencia", supabase.table("checklists").select("id").eq("foto_chave", chave).limit(1)
+        )
+        if not referencias.data:
+            _blob_apagar(chave)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def carregar_foto_etiqueta(chave):
+    """Baixa a foto em tamanho real (só quando alguém abre a foto)."""
+    return _blob_ler(chave)
+
+
+def carregar_miniatura_etiqueta(serie):
+    """Metadados + miniatura da foto mais recente do Nº de Série (ou None)."""
+    resp = executar(
+        "checklists.miniatura",
+        supabase.table("checklists")
+        .select("foto_chave,foto_tamanho,foto_miniatura")
+        .eq("numero_serie", serie)
+        .not_.is_("foto_chave", "null")
+        .order("id", desc=True)
+        .limit(1),
+    )
+    return resp.data[0] if resp.data else None
+
+
+def exibir_foto_etiqueta(serie):
+    foto = carregar_miniatura_etiqueta(serie)
+    if not foto:
+        return
+
+    if foto.get("foto_miniatura"):
+        st.image(base64.b64decode(foto["foto_miniatura"]), caption="📷 Etiqueta (miniatura)")
+    if st.button(f"🔍 Abrir foto ({(foto.get('foto_tamanho') or 0) // 1024} KB)", key=f"abrir_foto_{serie}"):
+        try:
+            st.image(carregar_foto_etiqueta(foto["foto_chave"]), caption="📷 Etiqueta")
+        except Exception as e:
+            st.error(f"Erro ao carregar a foto: {e}")
+
+
+@medir("salvar_checklist")
 def salvar_checklist(serie, resultados, usuario, foto_etiqueta=None, reinspecao=False):
     # Verifica duplicidade, exceto em caso de reinspeção
-    existe = supabase.table("checklists").select("numero_serie").eq("numero_serie", serie).execute()
-    if not reinspecao and existe.data:
-        st.error("⚠️ INVÁLIDO! DUPLICIDADE – Este Nº de Série já foi inspecionado.")
-        return None
+    if not reinspecao:
+        # ✅ já conhecida na réplica: recusa sem ir ao banco
+        if replica_consultar("SELECT 1 FROM checklists WHERE numero_serie = ? LIMIT 1", (serie,)):
+            st.error("⚠️ INVÁLIDO! DUPLICIDADE – Este Nº de Série já foi inspecionado.")
+            return None
+        existe = executar(
+            "checklists.duplicidade", supabase.table("checklists").select("id").eq("numero_serie", serie).limit(1)
+        )
+        if existe.data:
+            st.error("⚠️ INVÁLIDO! DUPLICIDADE – Este Nº de Série já foi inspecionado.")
+            return None
 
     # Determina se o produto foi reprovado
     reprovado = any(info["status"] == "Não Conforme" for info in resultados.values())
@@ -88,17 +901,20 @@ def salvar_checklist(serie, resultados, usuario, foto_etiqueta=None, reinspecao=
     # Pega a hora atual em São Paulo e converte para UTC
     data_hora_utc = datetime.datetime.now(TZ).astimezone(pytz.UTC).isoformat()
 
-    # Converte a foto para base64 se houver
-    foto_base64 = None
+    # Grava a foto no blob store (a linha guarda só chave, tamanho, hash e miniatura)
+    foto_campos = None
     if foto_etiqueta is not None:
         try:
-            foto_bytes = foto_etiqueta.getvalue()
-            foto_base64 = base64.b64encode(foto_bytes).decode()
+            foto_campos = salvar_foto_etiqueta(
+                serie, foto_etiqueta.getvalue(), getattr(foto_etiqueta, "type", None) or "image/jpeg"
+            )
         except Exception as e:
-            st.error(f"Erro ao processar a foto: {e}")
-            foto_base64 = None
+            # sem a foto o checklist não é gravado: o inspetor tenta de novo
+            st.error(f"❌ Erro ao gravar a foto, checklist não salvo: {e}")
+            return None
 
-    # Itera sobre os itens do checklist
+    # Monta todas as linhas do checklist (mesmas colunas em todas, exigência do insert em lote)
+    linhas = []
     for item, info in resultados.items():
         payload = {
             "numero_serie": serie,
@@ -112,84 +928,790 @@ def salvar_checklist(serie, resultados, usuario, foto_etiqueta=None, reinspecao=
         }
 
         # Só inclui a foto para o item "Etiqueta"
-        if item == "Etiqueta" and foto_base64:
-            payload["foto_etiqueta"] = foto_base64
+        if foto_campos:
+            payload.update(foto_campos if item.upper() == "ETIQUETA" else dict.fromkeys(foto_campos))
 
-        print("Enviando para Supabase:", payload)
+        linhas.append(payload)
 
-        try:
-            supabase.table("checklists").insert(payload).execute()
-        except APIError as e:
+    # ✅ Um único insert em lote: o PostgREST grava todas as linhas ou nenhuma
+    try:
+        res = executar("checklists.insert", supabase.table("checklists").insert(linhas))
+    except Exception as e:
+        # insert falhou: a foto já enviada não pode ficar no bucket sem linha
+        if foto_campos:
+            descartar_foto_etiqueta(foto_campos["foto_chave"])
+        if isinstance(e, APIError):
             st.error("❌ Erro ao salvar no banco de dados.")
             st.write("Detalhes do erro:", str(e))
-            raise
+        raise
+    checklists_anexar(res.data or [])
 
     st.success(f"✅ Checklist salvo com sucesso para o Nº de Série {serie}")
     return True
 
 
-def carregar_apontamentos():
-    """Rápido: carrega só os últimos apontamentos (igual MOLA)."""
-    try:
-        resp = (
-            supabase.table("apontamentos")
-            .select("*")
-            .order("data_hora", desc=True)
-            .limit(2000)
-            .execute()
+def ultimos_apontamentos_do_dia(tipo_producao, n=10):
+    """Os n apontamentos mais recentes de hoje na linha informada (índice por dia e tipo)."""
+    linhas = replica_consultar(
+        "SELECT op, numero_serie, data_hora FROM apontamentos WHERE dia = ? AND tipo_producao = ? "
+        "ORDER BY data_hora DESC LIMIT ?",
+        (datetime.datetime.now(TZ).date().isoformat(), tipo_producao, n),
+    )
+    return pd.DataFrame(
+        [
+            {"op": r["op"], "numero_serie": r["numero_serie"], "Hora": _hora_local(r["data_hora"]).strftime("%d/%m/%Y %H:%M:%S")}
+            for r in linhas
+        ],
+        columns=["op", "numero_serie", "Hora"],
+    )
+
+
+def producao_por_hora(tipo_producao):
+    """{hora: quantidade} do dia para a linha informada."""
+    linhas = replica_consultar(
+        "SELECT hora, COUNT(DISTINCT numero_serie) AS n FROM apontamentos "
+        "WHERE dia = ? AND tipo_producao = ? GROUP BY hora",
+        (datetime.datetime.now(TZ).date().isoformat(), tipo_producao),
+    )
+    return {r["hora"]: r["n"] for r in linhas}
+
+
+@st.cache_resource
+def _cache_apontamentos():
+    """Estado compartilhado dos apontamentos: versão (aviso às telas) e séries já gravadas hoje.
+
+    "series_hoje" é o filtro de duplicidade em memória, para recusar repetidas sem
+    ir ao banco; os dados em si ficam na réplica.
+    """
+    return {
+        "versao": 0,
+        "dia": None,
+        "series_hoje": set(),
+        "series_semeadas": None,  # dia em que series_hoje foi completado com a réplica
+        "lock": threading.Lock(),
+    }
+
+
+def versao_apontamentos():
+    """Contador que muda a cada apontamento novo na réplica (canal de aviso das telas)."""
+    return _cache_apontamentos()["versao"]
+
+
+def _virar_dia(cache, hoje):
+    """Zera o filtro do dia quando a data muda (chamar com o lock)."""
+    if cache["dia"] != hoje:
+        cache["dia"] = hoje
+        cache["series_hoje"] = set()
+
+
+def ressincronizar_apontamentos():
+    """Recarrega a tabela de apontamentos inteira na réplica e refaz o filtro de duplicidade do dia."""
+    _replica_sincronizar("apontamentos", resync=True)
+    cache = _cache_apontamentos()
+    with cache["lock"]:
+        cache["series_semeadas"] = None
+        cache["versao"] += 1  # painel e últimos 10 releem
+    _semear_series_hoje(cache)
+
+
+def _semear_series_hoje(cache):
+    """Completa series_hoje com as séries do dia na réplica (thread do hub, uma vez por dia)."""
+    hoje = datetime.datetime.now(TZ).date()
+    with cache["lock"]:
+        _virar_dia(cache, hoje)
+        if cache["series_semeadas"] == hoje:
+            return
+    linhas = replica_consultar("SELECT DISTINCT numero_serie FROM apontamentos WHERE dia = ?", (hoje.isoformat(),))
+    with cache["lock"]:
+        if cache["dia"] == hoje:
+            cache["series_hoje"].update(r["numero_serie"] for r in linhas)
+            cache["series_semeadas"] = hoje
+
+
+def serie_ja_apontada(serie):
+    """True se a série já foi gravada hoje: consulta em memória, compartilhada por todas as sessões.
+
+    O conjunto é semeado pelo hub com as séries do dia e mantido pelos inserts
+    (desta e das outras estações). False só quer dizer "não conhecida": quem
+    decide continua sendo a chave única no banco.
+    """
+    cache = _cache_apontamentos()
+    with cache["lock"]:
+        _virar_dia(cache, datetime.datetime.now(TZ).date())
+        return str(serie).strip() in cache["series_hoje"]
+
+
+def apontamentos_anexar(cache, inseridos):
+    """Grava na réplica as linhas inseridas (ou trazidas pelo hub/realtime) e atualiza o filtro do dia."""
+    if not inseridos:
+        return
+    novos = replica_gravar("apontamentos", inseridos)
+    hoje = datetime.datetime.now(TZ).date()
+    with cache["lock"]:
+        _virar_dia(cache, hoje)
+        cache["series_hoje"].update(r["numero_serie"] for r in inseridos if _hora_local(r["data_hora"]).date() == hoje)
+        if novos:
+            cache["versao"] += 1  # nada novo (ex.: linha já recebida pelo realtime) não acorda as telas
+
+
+def _linha_apontamento(serie, op, tipo_producao=None, agora=None):
+    """Linha de apontamento no formato da fila local (dia = dia de produção em SP)."""
+    agora = agora or datetime.datetime.now(TZ)
+    return {
+        "numero_serie": str(serie).strip(),
+        "op": str(op).strip(),
+        "tipo_producao": tipo_producao,
+        "data_hora": agora.astimezone(pytz.UTC).isoformat(),
+        "dia": agora.astimezone(TZ).date().isoformat(),
+    }
+
+
+def _enviar_apontamentos(linhas):
+    """Envia um lote de apontamentos em uma única chamada.
+
+    Devolve ("inserido"/"duplicado" por linha, linhas inseridas como voltaram do banco).
+
+    A duplicidade (mesma série no mesmo dia de produção) é garantida pela chave única
+    (numero_serie, dia_producao) no banco: o upsert ignora conflitos e devolve só as
+    linhas realmente inseridas. Levanta exceção em falha de rede/banco.
+    """
+    resultados = ["duplicado"] * len(linhas)
+    dados = {}
+    for i, linha in enumerate(linhas):
+        chave = (linha["dia"], linha["numero_serie"])
+        if chave in dados:
+            continue  # repetida dentro do próprio lote
+        dados[chave] = (
+            i,
+            {
+                "numero_serie": linha["numero_serie"],
+                "op": linha["op"],
+                "data_hora": linha["data_hora"],
+                "dia_producao": linha["dia"],
+                "tipo_producao": linha.get("tipo_producao"),
+            },
         )
 
-        df = pd.DataFrame(resp.data)
+    if not dados:
+        return resultados, []
 
-        if not df.empty:
-            df["data_hora"] = pd.to_datetime(df["data_hora"], errors="coerce", utc=True).dt.tz_convert(TZ)
+    res = executar(
+        "apontamentos.upsert",
+        supabase.table("apontamentos").upsert(
+            [d for _, d in dados.values()], on_conflict="numero_serie,dia_producao", ignore_duplicates=True
+        ),
+    )
+    inseridos = res.data or []
+    for r in inseridos:
+        chave = (str(r["dia_producao"]), r["numero_serie"])
+        if chave in dados:
+            resultados[dados[chave][0]] = "inserido"
+    return resultados, inseridos
 
-        return df
 
+# ✅ ATUALIZADO: uma chamada só (sem select antes do insert)
+@medir("salvar_apontamento")
+def salvar_apontamento(serie, op, tipo_producao=None):
+    """Insere o apontamento e retorna "inserido", "duplicado" (série já apontada hoje) ou "erro"."""
+    if serie_ja_apontada(serie):
+        return "duplicado"
+    linha = _linha_apontamento(serie, op, tipo_producao)
+    try:
+        resultados, inseridos = _enviar_apontamentos([linha])
+        apontamentos_anexar(_cache_apontamentos(), inseridos)
+        return resultados[0]
     except Exception as e:
-        st.error(f"Erro ao carregar apontamentos: {e}")
-        return pd.DataFrame()
+        st.error(f"Erro ao inserir apontamento: {e}")
+        return "erro"
 
 
-# ✅ ATUALIZADO (rápido e sem select *)
-def salvar_apontamento(serie, op, tipo_producao=None):
-    serie = str(serie).strip()
-    op = str(op).strip()
-
-    # janela do "hoje" em SP, convertida para UTC
-    hoje_sp = datetime.datetime.now(TZ).date()
-    inicio_sp = TZ.localize(datetime.datetime.combine(hoje_sp, datetime.time.min))
-    fim_sp = TZ.localize(datetime.datetime.combine(hoje_sp, datetime.time.max))
-    inicio_utc = inicio_sp.astimezone(pytz.UTC).isoformat()
-    fim_utc = fim_sp.astimezone(pytz.UTC).isoformat()
-
-    # checagem leve
-    response = (
-        supabase.table("apontamentos")
-        .select("id")
-        .eq("numero_serie", serie)
-        .gte("data_hora", inicio_utc)
-        .lte("data_hora", fim_utc)
-        .limit(1)
-        .execute()
+@medir("salvar_apontamentos_lote")
+def salvar_apontamentos_lote(leituras):
+    """Grava um lote de leituras (série, op, tipo_producao, lido_em) em uma única chamada.
+
+    Devolve o resultado de cada leitura, na ordem: "inserido", "duplicado" (já
+    apontada hoje), o retorno da fila local (só sem conexão/timeout) ou "erro"
+    (o banco recusou: a mensagem real vai para a tela e nada é enfileirado).
+    """
+    resultados = ["duplicado"] * len(leituras)
+    # ✅ séries já conhecidas de hoje nem vão ao banco
+    enviar = [i for i, (serie, *_) in enumerate(leituras) if not serie_ja_apontada(serie)]
+    if not enviar:
+        return resultados
+
+    linhas = [_linha_apontamento(serie, op, tipo, lido_em) for serie, op, tipo, lido_em in (leituras[i] for i in enviar)]
+    try:
+        enviados, inseridos = _enviar_apontamentos(linhas)
+    except Exception as e:
+        if _erro_servidor(e):
+            st.error(f"❌ O banco recusou o lote: {e}")
+            for i in enviar:
+                resultados[i] = "erro"
+            return resultados
+        st.warning(f"⚠️ Sem conexão com o banco ({e}). O lote foi para a fila local.")
+        for i in enviar:
+            serie, op, tipo, lido_em = leituras[i]
+            resultados[i] = enfileirar_apontamento(serie, op, tipo, agora=lido_em)
+        return resultados
+    for i, r in zip(enviar, enviados):
+        resultados[i] = r
+    apontamentos_anexar(_cache_apontamentos(), inseridos)
+    return resultados
+
+
+# =============================
+# Fila local de apontamentos (offline)
+# =============================
+# Cada leitura vai primeiro para um SQLite em modo WAL e é confirmada na hora;
+# uma thread de fundo descarrega a fila no Supabase em lotes, com retry e backoff.
+FILA_DB = Path(os.getenv("FILA_APONTAMENTOS_DB", Path(__file__).parent / "fila_apontamentos.db"))
+FILA_LOTE = 50
+FILA_INTERVALO_SEG = 2
+FILA_BACKOFF_MAX_SEG = 60
+FILA_RETENCAO_DIAS = 7  # linhas já resolvidas (inserido/duplicado/erro) são apagadas depois disso
+FILA_LIMPEZA_SEG = 3600
+# Só erro de dado da própria linha é permanente: 22xxx (valor inválido), 23xxx (restrição; 23505 é
+# a chave única, que o upsert já trata) e corpo inválido. Esquema/permissão (42xxx, PGRST2xx) é
+# erro de implantação: a fila espera com backoff até corrigirem.
+FILA_ERROS_PERMANENTES = ("22", "23", "PGRST102")
+
+
+def _fila_conectar():
+    con = sqlite3.connect(FILA_DB, timeout=10, isolation_level=None, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=FULL")
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fila_apontamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_serie TEXT NOT NULL,
+            op TEXT NOT NULL,
+            tipo_producao TEXT,
+            data_hora TEXT NOT NULL,
+            dia TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente',  -- pendente | inserido | duplicado | erro
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT
+        )
+        """
     )
-    if response.data:
-        return False
+    con.execute("CREATE INDEX IF NOT EXISTS ix_fila_status ON fila_apontamentos (status, id)")
+    con.execute("CREATE INDEX IF NOT EXISTS ix_fila_dia_serie ON fila_apontamentos (dia, numero_serie)")
+    return con
+
+
+def _erro_servidor(e):
+    """True se o banco respondeu recusando a requisição (não é falha de rede/timeout)."""
+    return APIError is not Exception and isinstance(e, APIError)
+
+
+def _erro_permanente(e):
+    """Recusa que não passa tentando de novo (dado inválido ou restrição violada pela linha)."""
+    codigo = str(getattr(e, "code", None) or "")
+    return _erro_servidor(e) and codigo.startswith(FILA_ERROS_PERMANENTES) and codigo != "23505"
 
-    dados = {
-        "numero_serie": serie,
-        "op": op,
-        "data_hora": datetime.datetime.now(pytz.UTC).isoformat(),
+
+def _fila_marcar(fila, lote, resultados, inseridos, erros=None):
+    """Grava o resultado de cada linha enviada e anexa as inseridas ao cache."""
+    erros = erros or {}
+    with fila["lock"]:
+        fila["con"].executemany(
+            "UPDATE fila_apontamentos SET status = ?, erro = ? WHERE id = ?",
+            [(res, erros.get(r["id"]), r["id"]) for res, r in zip(resultados, lote)],
+        )
+    apontamentos_anexar(fila["apontamentos"], inseridos)
+
+
+def _fila_isolar(fila, lote):
+    """Lote recusado pelo banco: reenvia linha a linha; as recusadas de vez vão para status 'erro'.
+
+    Falha de rede no meio interrompe (exceção); o que já foi enviado fica gravado.
+    """
+    for r in lote:
+        try:
+            resultados, inseridos = _enviar_apontamentos([r])
+        except Exception as e:
+            if not _erro_permanente(e):
+                raise
+            _fila_marcar(fila, [r], ["erro"], [], {r["id"]: str(e)[:500]})
+            continue
+        _fila_marcar(fila, [r], resultados, inseridos)
+
+
+def _fila_limpar(fila):
+    """Apaga as linhas já resolvidas (inserido/duplicado/erro) mais antigas que a retenção."""
+    corte = (datetime.datetime.now(TZ).date() - datetime.timedelta(days=FILA_RETENCAO_DIAS)).isoformat()
+    with fila["lock"]:
+        fila["con"].execute(
+            "DELETE FROM fila_apontamentos WHERE status IN ('inserido', 'duplicado', 'erro') AND dia < ?", (corte,)
+        )
+    fila["limpo_em"] = time.time()
+
+
+def _fila_descarregar(fila):
+    """Loop da thread de fundo: envia lotes pendentes; em erro espera com backoff exponencial.
+
+    Linha recusada pelo banco não trava a fila: o lote é reenviado linha a linha e
+    a recusada vai para status 'erro' (mostrado na página de apontamento).
+    """
+    espera = FILA_INTERVALO_SEG
+    while True:
+        fila["acordar"].wait(timeout=espera)
+        fila["acordar"].clear()
+
+        with fila["lock"]:
+            lote = [
+                dict(r)
+                for r in fila["con"].execute(
+                    "SELECT * FROM fila_apontamentos WHERE status = 'pendente' ORDER BY id LIMIT ?", (FILA_LOTE,)
+                )
+            ]
+        if not lote:
+            if time.time() - fila["limpo_em"] > FILA_LIMPEZA_SEG:
+                _fila_limpar(fila)
+            espera = FILA_INTERVALO_SEG
+            continue
+
+        try:
+            try:
+                resultados, inseridos = _enviar_apontamentos(lote)
+            except Exception as e:
+                if not _erro_permanente(e):
+                    raise
+                _fila_isolar(fila, lote)
+            else:
+                _fila_marcar(fila, lote, resultados, inseridos)
+        except Exception as e:
+            with fila["lock"]:
+                # rede, timeout, esquema/permissão: a linha continua pendente e volta com backoff
+                fila["con"].executemany(
+                    "UPDATE fila_apontamentos SET tentativas = tentativas + 1, erro = ? "
+                    "WHERE id = ? AND status = 'pendente'",
+                    [(str(e)[:500], r["id"]) for r in lote],
+                )
+            fila["ultimo_erro"] = str(e)
+            espera = min(max(espera, 1) * 2, FILA_BACKOFF_MAX_SEG)
+            continue
+
+        fila["ultimo_erro"] = None
+        # lote cheio: provavelmente há mais na fila, segue sem esperar
+        espera = 0 if len(lote) == FILA_LOTE else FILA_INTERVALO_SEG
+
+
+@st.cache_resource
+def _fila_apontamentos():
+    """Fila do processo (conexão SQLite + thread de descarga, iniciada uma única vez)."""
+    fila = {
+        "con": _fila_conectar(),
+        "lock": threading.Lock(),
+        "acordar": threading.Event(),
+        "ultimo_erro": None,
+        "limpo_em": 0.0,
+        # resolvido aqui (thread do script): a thread de fundo não chama funções cacheadas
+        "apontamentos": _cache_apontamentos(),
     }
-    if tipo_producao is not None:
-        dados["tipo_producao"] = tipo_producao
+    threading.Thread(target=_fila_descarregar, args=(fila,), name="fila-apontamentos", daemon=True).start()
+    return fila
+
+
+@medir("enfileirar_apontamento")
+def enfileirar_apontamento(serie, op, tipo_producao=None, agora=None):
+    """Grava a leitura na fila local e retorna na hora: "enfileirado" ou "duplicado" (mesma série hoje).
+
+    agora: hora da leitura (padrão: agora); o lote passa a hora de cada bipagem.
+    """
+    # ✅ repetida conhecida (leitor disparou duas vezes, outra estação já gravou): recusa na hora
+    if serie_ja_apontada(serie):
+        return "duplicado"
+    linha = _linha_apontamento(serie, op, tipo_producao, agora)
+
+    fila = _fila_apontamentos()
+    with fila["lock"]:
+        ja_lida = fila["con"].execute(
+            "SELECT 1 FROM fila_apontamentos WHERE dia = ? AND numero_serie = ? AND status IN ('pendente', 'inserido') "
+            "LIMIT 1",
+            (linha["dia"], linha["numero_serie"]),
+        ).fetchone()
+        if ja_lida:
+            return "duplicado"
+        fila["con"].execute(
+            "INSERT INTO fila_apontamentos (numero_serie, op, tipo_producao, data_hora, dia) "
+            "VALUES (:numero_serie, :op, :tipo_producao, :data_hora, :dia)",
+            linha,
+        )
+    fila["acordar"].set()
+    return "enfileirado"
+
+
+def status_fila_apontamentos():
+    """Pendentes na fila, duplicados detectados hoje na sincronização, recusadas pelo banco e último erro de envio."""
+    fila = _fila_apontamentos()
+    hoje = datetime.datetime.now(TZ).date().isoformat()
+    with fila["lock"]:
+        pendentes = fila["con"].execute(
+            "SELECT COUNT(*) FROM fila_apontamentos WHERE status = 'pendente'"
+        ).fetchone()[0]
+        duplicados = [
+            r["numero_serie"]
+            for r in fila["con"].execute(
+                "SELECT numero_serie FROM fila_apontamentos WHERE dia = ? AND status = 'duplicado' ORDER BY id",
+                (hoje,),
+            )
+        ]
+        erros = [
+            (r["numero_serie"], r["erro"])
+            for r in fila["con"].execute(
+                "SELECT numero_serie, erro FROM fila_apontamentos WHERE status = 'erro' AND dia >= ? ORDER BY id",
+                ((datetime.datetime.now(TZ).date() - datetime.timedelta(days=FILA_RETENCAO_DIAS)).isoformat(),),
+            )
+        ]
+    return {"pendentes": pendentes, "duplicados": duplicados, "erros": erros, "ultimo_erro": fila["ultimo_erro"]}
+
+
+# =============================
+# Hub de dados do processo
+# =============================
+# Uma única thread por processo mantém a réplica local (apontamentos e checklists)
+# e os caches em memória; todas as sessões (estações e TVs) só leem localmente.
+HUB_INTERVALO_SEG = 5
+# com o realtime conectado a consulta de apontamentos vira só uma rede de segurança
+# (o realtime não traz checklists: esses seguem no intervalo curto)
+HUB_INTERVALO_REALTIME_SEG = 60
+REALTIME_ATIVO = os.getenv("REALTIME_APONTAMENTOS", "1") != "0"
+
+
+def sincronizar_replica(hub, apontamentos=True):
+    """Traz as linhas novas das duas tabelas para a réplica (na primeira vez, as tabelas inteiras)."""
+    if apontamentos:
+        _replica_sincronizar("apontamentos", lambda linhas: apontamentos_anexar(hub["apontamentos"], linhas))
+        hub["apontamentos_em"] = time.time()
+    _semear_series_hoje(hub["apontamentos"])
+    _replica_sincronizar(
+        "checklists", lambda linhas: (replica_gravar("checklists", linhas), analise_anexar(hub["analise"], linhas))
+    )
+
+
+def _hub_atualizar(hub):
+    while True:
+        acordado = hub["acordar"].wait(timeout=HUB_INTERVALO_SEG)
+        hub["acordar"].clear()
+        # apontamentos chegam pelo realtime quando conectado; a consulta deles só de tempos em tempos
+        apontamentos = (
+            acordado
+            or not hub["realtime"]
+            or time.time() - hub["apontamentos_em"] >= HUB_INTERVALO_REALTIME_SEG
+        )
+        try:
+            sincronizar_replica(hub, apontamentos=apontamentos)
+            hub["ultimo_erro"] = None
+            hub["atualizado_em"] = time.time()
+        except Exception as e:
+            hub["ultimo_erro"] = str(e)
+
+
+def _hub_realtime(hub):
+    """Assina os INSERTs de apontamentos (Supabase Realtime) e anexa cada linha no cache na hora.
+
+    Roda em thread própria com loop asyncio; se cair, reconecta e o hub volta a
+    consultar no intervalo curto enquanto isso. Só conta como conectado depois que
+    o servidor confirma a assinatura (ou chega o primeiro evento); exige a tabela
+    na publicação supabase_realtime (sql/apontamentos_realtime.sql).
+    """
+    import asyncio
 
     try:
-        res = supabase.table("apontamentos").insert(dados).execute()
-        return bool(res.data)
-    except Exception as e:
-        st.error(f"Erro ao inserir apontamento: {e}")
-        return False
+        from supabase import acreate_client
+    except ImportError:
+        return
+
+    async def escutar():
+        cliente = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+
+        def ao_inserir(payload):
+            hub["realtime"] = True
+            registro = (payload.get("data") or {}).get("record") or payload.get("new")
+            if registro:
+                apontamentos_anexar(hub["apontamentos"], [registro])
+
+        def ao_mudar_estado(estado, erro=None):
+            estado = str(getattr(estado, "value", estado))
+            if estado == "SUBSCRIBED":
+                hub["realtime"] = True
+            elif estado in ("CHANNEL_ERROR", "TIMED_OUT", "CLOSED"):
+                hub["realtime"] = False
+                hub["ultimo_erro"] = f"realtime: {estado} {erro or ''}".strip()
+                hub["acordar"].set()  # volta já para a consulta no intervalo curto
+
+        canal = cliente.channel("apontamentos-insert")
+        canal.on_postgres_changes("INSERT", schema="public", table="apontamentos", callback=ao_inserir)
+        await canal.subscribe(ao_mudar_estado)
+        await cliente.realtime.listen()
+
+    while True:
+        try:
+            asyncio.run(escutar())
+        except Exception as e:
+            hub["ultimo_erro"] = f"realtime: {e}"
+        hub["realtime"] = False
+        time.sleep(HUB_INTERVALO_SEG * 2)
+
+
+@st.cache_resource
+def _hub_dados():
+    """Hub do processo: caches compartilhados + thread de atualização (iniciada uma única vez)."""
+    hub = {
+        "apontamentos": _cache_apontamentos(),
+        "analise": _cache_analise(),
+        "acordar": threading.Event(),
+        "realtime": False,
+        "ultimo_erro": None,
+        "atualizado_em": None,
+        "apontamentos_em": 0.0,
+    }
+    registrar_estrutura("analise_agregados", hub["analise"], "dias")
+    registrar_estrutura("series_hoje", hub["apontamentos"], "series_hoje")
+    hub["acordar"].set()  # primeira volta já na partida (réplica e filtro de duplicidade do dia)
+    threading.Thread(target=_hub_atualizar, args=(hub,), name="hub-dados", daemon=True).start()
+    if REALTIME_ATIVO:
+        threading.Thread(target=_hub_realtime, args=(hub,), name="hub-realtime", daemon=True).start()
+    return hub
+
+
+# =============================
+# Leitura pela câmera (código de barras)
+# =============================
+CAMERA_LARGURA = 640  # frames reduzidos para esta largura antes de decodificar
+CAMERA_JANELA_DEDUP_SEG = 3.0  # o mesmo código visto de novo dentro da janela é ignorado
+CAMERA_OCIOSO_SEG = 120  # worker encerra sem frames por este tempo (volta quando a câmera liga)
+
+
+def _regiao_codigo(cinza, cv2):
+    """Recorte da região com barras (gradiente horizontal forte) ou None se não achar."""
+    grad_x = cv2.Sobel(cinza, cv2.CV_32F, 1, 0, ksize=-1)
+    grad_y = cv2.Sobel(cinza, cv2.CV_32F, 0, 1, ksize=-1)
+    grad = cv2.convertScaleAbs(cv2.subtract(grad_x, grad_y))
+    _, mascara = cv2.threshold(cv2.blur(grad, (9, 9)), 225, 255, cv2.THRESH_BINARY)
+    mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7)))
+    mascara = cv2.dilate(cv2.erode(mascara, None, iterations=4), None, iterations=4)
+    contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contornos:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contornos, key=cv2.contourArea))
+    margem = 20
+    return cinza[max(0, y - margem) : y + h + margem, max(0, x - margem) : x + w + margem]
+
+
+def _decodificar_frame(img, cv2, pyzbar):
+    """Códigos numéricos de OP (11) ou Série (9) encontrados no frame (BGR)."""
+    h, w = img.shape[:2]
+    if w > CAMERA_LARGURA:
+        img = cv2.resize(img, (CAMERA_LARGURA, int(h * CAMERA_LARGURA / w)), interpolation=cv2.INTER_AREA)
+    cinza = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    roi = _regiao_codigo(cinza, cv2)
+    achados = pyzbar.decode(roi) if roi is not None and roi.size else []
+    if not achados:
+        achados = pyzbar.decode(cinza)
+
+    codigos = []
+    for achado in achados:
+        codigo = achado.data.decode("ascii", errors="ignore").strip()
+        if codigo.isdigit() and len(codigo) in (9, 11):
+            codigos.append(codigo)
+    return codigos
+
+
+def _camera_worker(estado):
+    """Decodifica o frame mais recente; frames que chegam durante uma decodificação são descartados."""
+    import cv2
+    from pyzbar import pyzbar
+
+    while estado["ativo"]:
+        if not estado["novo"].wait(timeout=1):
+            if time.monotonic() - estado["ultimo_frame"] > CAMERA_OCIOSO_SEG:
+                break
+            continue
+        estado["novo"].clear()
+        with estado["lock"]:
+            img, estado["frame"] = estado["frame"], None
+        if img is None:
+            continue
+
+        estado["ocupado"] = True
+        try:
+            with medir("camera.decodificar"):
+                codigos = _decodificar_frame(img, cv2, pyzbar)
+        except Exception as e:
+            estado["ultimo_erro"] = str(e)
+            codigos = []
+        finally:
+            estado["ocupado"] = False
+
+        agora = time.monotonic()
+        with estado["lock"]:
+            estado["decodificados"] += 1
+            for codigo in codigos:
+                if agora - estado["vistos"].get(codigo, -CAMERA_JANELA_DEDUP_SEG) >= CAMERA_JANELA_DEDUP_SEG:
+                    estado["codigos"].append(codigo)
+                estado["vistos"][codigo] = agora  # parado na frente da câmera continua "visto"
+            estado["vistos"] = {c: t for c, t in estado["vistos"].items() if agora - t < CAMERA_JANELA_DEDUP_SEG}
+    estado["thread"] = None
+
+
+def decodificador_camera(estado=None):
+    """Estado da câmera da sessão (frame atual, códigos lidos, contadores); (re)inicia o worker se preciso."""
+    if estado is None:
+        estado = {
+            "frame": None,
+            "novo": threading.Event(),
+            "ocupado": False,
+            "ativo": True,
+            "ultimo_frame": time.monotonic(),
+            "codigos": deque(maxlen=50),
+            "vistos": {},
+            "decodificados": 0,
+            "descartados": 0,
+            "ultimo_erro": None,
+            "thread": None,
+            "lock": threading.Lock(),
+        }
+    estado["ativo"] = True
+    if estado["thread"] is None:
+        estado["ultimo_frame"] = time.monotonic()
+        estado["thread"] = threading.Thread(target=_camera_worker, args=(estado,), name="camera-codigos", daemon=True)
+        estado["thread"].start()
+    return estado
+
+
+def camera_receber_frame(estado, frame):
+    """Callback de frame do webrtc (thread do webrtc): só guarda o frame, nunca decodifica aqui."""
+    estado["ultimo_frame"] = time.monotonic()
+    if estado["ocupado"]:
+        estado["descartados"] += 1
+    else:
+        with estado["lock"]:
+            estado["frame"] = frame.to_ndarray(format="bgr24")
+        estado["novo"].set()
+    return frame
+
+
+def camera_codigos_lidos(estado):
+    """Retira os códigos lidos desde a última chamada (já sem repetições da janela)."""
+    with estado["lock"]:
+        codigos = list(estado["codigos"])
+        estado["codigos"].clear()
+    return codigos
+
+
+# =============================
+# Exportação (streaming, memória limitada a uma página)
+# =============================
+EXPORTACAO_PASSO = 5000
+# Tipos de saída por coluna; a foto vai só por referência (chave, tamanho e hash)
+ESQUEMA_EXPORTACAO = {
+    "checklists": {
+        "id": "int64",
+        "numero_serie": "string",
+        "item": "string",
+        "status": "string",
+        "observacoes": "string",
+        "inspetor": "string",
+        "data_hora": "timestamp",
+        "produto_reprovado": "bool",
+        "reinspecao": "bool",
+        "foto_chave": "string",
+        "foto_tamanho": "int64",
+        "foto_sha256": "string",
+    },
+    "apontamentos": {
+        "id": "int64",
+        "numero_serie": "string",
+        "op": "string",
+        "tipo_producao": "string",
+        "data_hora": "timestamp",
+        "dia_producao": "date",
+    },
+}
+
+
+def _paginas_exportacao(tabela, inicio=None, fim=None, tipo_producao=None, inspetor=None, passo=EXPORTACAO_PASSO):
+    """Gera as páginas da tabela (keyset por id) com os filtros aplicados no banco."""
+    colunas = ",".join(ESQUEMA_EXPORTACAO[tabela])
+    ultimo_id = None
+    while True:
+        consulta = supabase.table(tabela).select(colunas).order("id").limit(passo)
+        if ultimo_id is not None:
+            consulta = consulta.gt("id", ultimo_id)
+        if inicio:
+            consulta = consulta.gte(
+                "data_hora", TZ.localize(datetime.datetime.combine(inicio, datetime.time.min)).astimezone(pytz.UTC).isoformat()
+            )
+        if fim:
+            consulta = consulta.lte(
+                "data_hora", TZ.localize(datetime.datetime.combine(fim, datetime.time.max)).astimezone(pytz.UTC).isoformat()
+            )
+        if tipo_producao and tabela == "apontamentos":
+            consulta = consulta.eq("tipo_producao", tipo_producao)
+        if inspetor and tabela == "checklists":
+            consulta = consulta.eq("inspetor", inspetor)
+
+        dados = executar(f"{tabela}.exportacao", consulta).data or []
+        if dados:
+            yield dados
+        if len(dados) < passo:
+            break
+        ultimo_id = dados[-1]["id"]
+
+
+def _tipar_pagina(linhas, esquema):
+    df = pd.DataFrame(linhas).reindex(columns=list(esquema))
+    for coluna, tipo in esquema.items():
+        if tipo == "timestamp":
+            df[coluna] = pd.to_datetime(df[coluna], errors="coerce", utc=True)
+        elif tipo == "date":
+            df[coluna] = pd.to_datetime(df[coluna], errors="coerce").dt.date
+        elif tipo == "bool":
+            df[coluna] = df[coluna] == "Sim"
+        elif tipo == "int64":
+            df[coluna] = pd.to_numeric(df[coluna], errors="coerce").astype("Int64")
+        else:
+            df[coluna] = df[coluna].astype("string")
+    return df
+
+
+def exportar_tabela(tabela, destino, formato="parquet", **filtros):
+    """Exporta a tabela para `destino` (Parquet zstd ou CSV gzip), uma página por vez.
+
+    Filtros: inicio/fim (datas, horário de SP), tipo_producao (apontamentos) e
+    inspetor (checklists). Retorna o número de linhas escritas.
+    """
+    esquema = ESQUEMA_EXPORTACAO[tabela]
+    total = 0
+
+    if formato == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        tipos_pa = {
+            "int64": pa.int64(),
+            "string": pa.string(),
+            "timestamp": pa.timestamp("us", tz="UTC"),
+            "bool": pa.bool_(),
+            "date": pa.date32(),
+        }
+        schema = pa.schema([(coluna, tipos_pa[tipo]) for coluna, tipo in esquema.items()])
+        with pq.ParquetWriter(destino, schema, compression="zstd") as escritor:
+            for pagina in _paginas_exportacao(tabela, **filtros):
+                escritor.write_table(pa.Table.from_pandas(_tipar_pagina(pagina, esquema), schema=schema, preserve_index=False))
+                total += len(pagina)
+    else:
+        with gzip.open(destino, "wt", encoding="utf-8", newline="") as arquivo:
+            for pagina in _paginas_exportacao(tabela, **filtros):
+                _tipar_pagina(pagina, esquema).to_csv(arquivo, header=total == 0, index=False)
+                total += len(pagina)
+
+    return total
 
 
 # =============================
@@ -322,6 +1844,8 @@ def checklist_qualidade(numero_serie, usuario):
             else:
                 modelos[i] = None
 
+        foto = st.file_uploader("📷 Foto da etiqueta (opcional)", type=["jpg", "jpeg", "png"], key=f"foto_{numero_serie}")
+
         submit = st.form_submit_button("💾 Salvar Checklist")
 
     if submit:
@@ -350,10 +1874,11 @@ def checklist_qualidade(numero_serie, usuario):
             dados_para_salvar[chave_item] = {"status": status_emoji_para_texto(resp), "obs": modelos.get(i)}
 
         try:
-            salvar_checklist(numero_serie, dados_para_salvar, usuario)
-            st.success(f"✅ Checklist do Nº de Série {numero_serie} salvo com sucesso!")
-            st.session_state.checklist_cache[numero_serie] = dados_para_salvar
-            time.sleep(0.5)
+            # None: não gravou (duplicidade ou foto), o erro já está na tela
+            if salvar_checklist(numero_serie, dados_para_salvar, usuario, foto_etiqueta=foto):
+                st.success(f"✅ Checklist do Nº de Série {numero_serie} salvo com sucesso!")
+                st.session_state.checklist_cache[numero_serie] = dados_para_salvar
+                time.sleep(0.5)
 
         except Exception as e:
             st.error(f"❌ Erro ao salvar checklist: {e}")
@@ -364,21 +1889,13 @@ def checklist_qualidade(numero_serie, usuario):
 def checklist_reinspecao(numero_serie, usuario):
     st.markdown(f"## 🔄 Reinspeção – Nº de Série: {numero_serie}")
 
-    df_checks = carregar_checklists()
-    df_inspecao = df_checks[(df_checks["numero_serie"] == numero_serie) & (df_checks["reinspecao"] != "Sim")]
-
-    if df_inspecao.empty:
+    # ✅ uma consulta por chave na réplica (última resposta de cada item)
+    checklist_original = checklist_por_serie(numero_serie)
+    if checklist_original is None:
         st.warning("Nenhum checklist de inspeção encontrado para reinspeção.")
         return False
 
-    hoje = datetime.datetime.now(TZ).date()
-    df_inspecao["data_hora"] = pd.to_datetime(df_inspecao["data_hora"])
-    df_inspecao_mesmo_dia = df_inspecao[df_inspecao["data_hora"].dt.date == hoje]
-    if df_inspecao_mesmo_dia.empty:
-        st.warning("Nenhum checklist de inspeção encontrado para hoje.")
-        return False
-
-    checklist_original = df_inspecao_mesmo_dia.sort_values("data_hora").iloc[-1]
+    exibir_foto_etiqueta(numero_serie)
 
     perguntas = [
         "Etiqueta do produto – As informações estão corretas / legíveis conforme modelo e gravação do eixo?",
@@ -424,16 +1941,9 @@ def checklist_reinspecao(numero_serie, usuario):
             cols = st.columns([7, 2, 2])
             chave = item_keys[i]
 
-            status_antigo = (
-                checklist_original.get(chave, {}).get("status")
-                if isinstance(checklist_original.get(chave), dict)
-                else checklist_original.get(chave)
-            )
-            obs_antigo = (
-                checklist_original.get(chave, {}).get("obs")
-                if isinstance(checklist_original.get(chave), dict)
-                else ""
-            )
+            resposta_antiga = checklist_original["itens"].get(chave, {})
+            status_antigo = resposta_antiga.get("status")
+            obs_antigo = resposta_antiga.get("obs") or ""
 
             if status_antigo == "Conforme":
                 resp_antiga = "✅"
@@ -486,8 +1996,11 @@ def checklist_reinspecao(numero_serie, usuario):
 
 # ================================
 # Página de Apontamento (1 leitor, OP obrigatório primeiro, depois Série)
-# ✅ NOVO: OP sozinha expira em 4s (start quando OP é lida) usando st_autorefresh(4000ms)
-# ✅ reset pós sucesso também limpa em 4s
+# ✅ OP sozinha expira em OP_TIMEOUT_SEG (start quando OP é lida), checado por fragment de 1s
+# ✅ reset pós sucesso também limpa em RESET_TIMEOUT_SEG
+# ✅ leitor, painel hora a hora e últimos 10 são fragments independentes:
+#    uma leitura reexecuta só o leitor; painel e tabela seguem o próprio intervalo
+# ✅ modo lote (palete): acumula pares OP/Série sem timers e grava tudo em uma chamada
 # ================================
 def pagina_apontamento():
     st.markdown("#  Registrar Apontamento")
@@ -495,10 +2008,7 @@ def pagina_apontamento():
 
     OP_TIMEOUT_SEG = 15
     RESET_TIMEOUT_SEG = 15
-
-    @st.cache_data(ttl=15)
-    def carregar_apontamentos_cache():
-        return carregar_apontamentos()
+    PAINEL_INTERVALO_SEG = 2
 
     tipo_producao = st.radio(
         "Tipo de produção:",
@@ -507,16 +2017,6 @@ def pagina_apontamento():
         key="tipo_producao_apontamento",
     )
 
-    df_apont = carregar_apontamentos_cache()
-    df_filtrado = (
-        df_apont[
-            (df_apont.get("tipo_producao", "").astype(str).str.contains(tipo_producao, case=False, na=False))
-            & (df_apont["data_hora"].dt.date == datetime.datetime.now(TZ).date())
-        ]
-        if not df_apont.empty
-        else pd.DataFrame()
-    )
-
     # ================================
     # Metas
     # ================================
@@ -533,20 +2033,35 @@ def pagina_apontamento():
         datetime.time(15, 0): 12,
     }
 
-    col_meta = st.columns(len(meta_hora))
-    col_prod = st.columns(len(meta_hora))
-    for i, (h, m) in enumerate(meta_hora.items()):
-        produzido = len(df_filtrado[df_filtrado["data_hora"].dt.hour == h.hour]) if not df_filtrado.empty else 0
-        col_meta[i].markdown(
-            f"<div style='background-color:#4CAF50;colorwhite;padding:10px;border-radius:5px;text-align:center'>"
-            f"<b>{h.strftime('%H:%M')}<br>{m}</b></div>".replace("colorwhite", "color:white;"),
-            unsafe_allow_html=True,
-        )
-        col_prod[i].markdown(
-            f"<div style='background-color:#000000;color:white;padding:10px;border-radius:5px;text-align:center'>"
-            f"<b>{h.strftime('%H:%M')}<br>{produzido}</b></div>",
-            unsafe_allow_html=True,
-        )
+    # ================================
+    # ✅ Painel hora a hora (fragment próprio): o tick só confere a versão dos
+    # apontamentos; o GROUP BY na réplica roda quando chegam dados novos
+    # ================================
+    @fragment(run_every=PAINEL_INTERVALO_SEG)
+    @medir("fragment.painel_hora_a_hora")
+    def painel_hora_a_hora():
+        chave = (versao_apontamentos(), tipo_producao, datetime.datetime.now(TZ).date())
+        if st.session_state.get("painel_apont_chave") != chave:
+            st.session_state["painel_apont"] = producao_por_hora(tipo_producao)
+            st.session_state["painel_apont_chave"] = chave
+        produzido_hora = st.session_state["painel_apont"]
+
+        col_meta = st.columns(len(meta_hora))
+        col_prod = st.columns(len(meta_hora))
+        for i, (h, m) in enumerate(meta_hora.items()):
+            produzido = produzido_hora.get(h.hour, 0)
+            col_meta[i].markdown(
+                f"<div style='background-color:#4CAF50;colorwhite;padding:10px;border-radius:5px;text-align:center'>"
+                f"<b>{h.strftime('%H:%M')}<br>{m}</b></div>".replace("colorwhite", "color:white;"),
+                unsafe_allow_html=True,
+            )
+            col_prod[i].markdown(
+                f"<div style='background-color:#000000;color:white;padding:10px;border-radius:5px;text-align:center'>"
+                f"<b>{h.strftime('%H:%M')}<br>{produzido}</b></div>",
+                unsafe_allow_html=True,
+            )
+
+    painel_hora_a_hora()
 
     # ================================
     # Estados
@@ -564,10 +2079,11 @@ def pagina_apontamento():
     # timer da OP sozinha
     st.session_state.setdefault("op_ts", None)
 
-    def resetar_leituras(limpar_msg=True, msg_erro=None):
+    def resetar_leituras(limpar_msg=True, msg_erro=None, limpar_input=True):
         st.session_state["serie_pendente"] = ""
         st.session_state["op_pendente"] = ""
-        st.session_state["input_leitor_apont"] = ""
+        if limpar_input:
+            st.session_state["input_leitor_apont"] = ""
         st.session_state["reset_after_success"] = False
         st.session_state["success_ts"] = None
         st.session_state["op_ts"] = None
@@ -575,45 +2091,22 @@ def pagina_apontamento():
             st.session_state["msg_ok"] = None
             st.session_state["erro_apont"] = msg_erro
 
-    op_atual = (st.session_state.get("op_pendente") or "").strip()
-    serie_atual = (st.session_state.get("serie_pendente") or "").strip()
-
-    # ================================
-    # ✅ AUTORERUN: 4s (só quando precisa)
-    # ================================
-    precisa_tick_op = bool(op_atual and not serie_atual)
-    precisa_tick_reset = bool(st.session_state.get("reset_after_success"))
-
-    if (precisa_tick_op or precisa_tick_reset) and AUTORELOAD_AVAILABLE:
-        st_autorefresh(interval=4000, key="tick_4s")
-
-    # ================================
-    # Regras de tempo (4s)
-    # ================================
-    if op_atual and not serie_atual and st.session_state.get("op_ts"):
-        if time.time() - st.session_state["op_ts"] >= OP_TIMEOUT_SEG:
-            resetar_leituras(limpar_msg=True, msg_erro="⏱️ Tempo expirado (4s). Bipe a OP novamente.")
-            st.rerun()
-
-    if st.session_state.get("reset_after_success") and st.session_state.get("success_ts"):
-        if time.time() - st.session_state["success_ts"] >= RESET_TIMEOUT_SEG:
-            resetar_leituras(limpar_msg=True, msg_erro=None)
-            st.rerun()
-
     # ================================
     # Callback do leitor (OP obrigatório primeiro)
     # ================================
     def processar_leitura_apont():
         leitura = (st.session_state.get("input_leitor_apont") or "").strip()
-        if not leitura:
-            return
+        st.session_state["input_leitor_apont"] = ""
+        if leitura:
+            processar_codigo_apont(leitura)
 
+    def processar_codigo_apont(leitura):
+        """Máquina OP -> Série: recebe o código do leitor de teclado ou da câmera."""
         st.session_state["erro_apont"] = None
         st.session_state["msg_ok"] = None
 
         if not leitura.isdigit():
             st.session_state["erro_apont"] = "⚠️ Leitura inválida. Use apenas códigos numéricos."
-            st.session_state["input_leitor_apont"] = ""
             return
 
         op_local = (st.session_state.get("op_pendente") or "").strip()
@@ -629,7 +2122,6 @@ def pagina_apontamento():
                 st.session_state["erro_apont"] = "⚠️ Primeiro a OP (11 dígitos). Depois a Série (9 dígitos)."
             else:
                 st.session_state["erro_apont"] = "⚠️ Código inválido. OP = 11 dígitos."
-            st.session_state["input_leitor_apont"] = ""
             return
 
         # OP já existe -> agora só aceita Série
@@ -641,10 +2133,8 @@ def pagina_apontamento():
                 st.session_state["erro_apont"] = "⚠️ OP já foi lida. Agora bipe apenas a Série (9 dígitos)."
             else:
                 st.session_state["erro_apont"] = "⚠️ Código inválido. Série = 9 dígitos."
-            st.session_state["input_leitor_apont"] = ""
         else:
             st.session_state["erro_apont"] = "⚠️ Já existe OP e Série pendentes. Aguarde o salvamento/reset."
-            st.session_state["input_leitor_apont"] = ""
             return
 
         # se já tem os dois, salva automático
@@ -652,14 +2142,13 @@ def pagina_apontamento():
         op = (st.session_state.get("op_pendente") or "").strip()
 
         if serie and op:
-            sucesso = salvar_apontamento(serie, op, tipo_producao)
+            # ✅ grava na fila local (não espera a rede); a thread de fundo envia ao Supabase
+            sucesso = enfileirar_apontamento(serie, op, tipo_producao) == "enfileirado"
 
             if sucesso:
                 st.session_state["msg_ok"] = f"✅ Apontado: Série {serie} | OP {op}. Próximo!"
                 st.session_state["erro_apont"] = None
 
-                st.cache_data.clear()
-
                 # ✅ depois do sucesso: reseta em 4s
                 st.session_state["reset_after_success"] = True
                 st.session_state["success_ts"] = time.time()
@@ -677,16 +2166,66 @@ def pagina_apontamento():
                 st.session_state["serie_pendente"] = ""
                 st.session_state["op_ts"] = time.time()
 
-        st.session_state["input_leitor_apont"] = ""
+    # ================================
+    # Modo lote: leituras vão para um buffer validado e são gravadas juntas
+    # ================================
+    st.session_state.setdefault("input_lote_apont", "")
+    st.session_state.setdefault("lote_apont", [])
+    st.session_state.setdefault("lote_op", "")
+    st.session_state.setdefault("lote_msg", None)
+    st.session_state.setdefault("lote_resultados", None)
+
+    def processar_leitura_lote():
+        leitura = (st.session_state.get("input_lote_apont") or "").strip()
+        st.session_state["input_lote_apont"] = ""
+        if leitura:
+            processar_codigo_lote(leitura)
+
+    def processar_codigo_lote(leitura):
+        lote = st.session_state["lote_apont"]
+        op = st.session_state["lote_op"]
+        if not leitura.isdigit():
+            msg = ("erro", "⚠️ Leitura inválida. Use apenas códigos numéricos.")
+        elif not op:
+            if len(leitura) == 11:
+                st.session_state["lote_op"] = leitura
+                msg = ("ok", "✅ OP lida. Agora bipe a Série (9 dígitos).")
+            else:
+                msg = ("erro", "⚠️ Primeiro a OP (11 dígitos). Depois a Série (9 dígitos).")
+        elif len(leitura) == 9:
+            if any(l["serie"] == leitura for l in lote):
+                msg = ("erro", f"⚠️ Série {leitura} já está no lote.")
+            else:
+                lote.append({"serie": leitura, "op": op, "tipo": tipo_producao, "lido_em": datetime.datetime.now(TZ)})
+                st.session_state["lote_op"] = ""
+                msg = ("ok", f"➕ Série {leitura} | OP {op} no lote ({len(lote)}).")
+        elif len(leitura) == 11:
+            msg = ("erro", "⚠️ OP já foi lida. Agora bipe apenas a Série (9 dígitos).")
+        else:
+            msg = ("erro", "⚠️ Código inválido. Série = 9 dígitos.")
+        st.session_state["lote_msg"] = msg
 
-    # UI input
-    st.text_input(
-        "Leitor",
-        key="input_leitor_apont",
-        placeholder="Aproxime o leitor (OP 11 primeiro, depois Série 9)...",
-        label_visibility="collapsed",
-        on_change=processar_leitura_apont,
-    )
+    # ================================
+    # 📷 Câmera: o webrtc entrega frames a um worker; os códigos lidos entram
+    # na mesma máquina OP -> Série (ou no lote), drenados no tick do leitor
+    # ================================
+    camera_ativa = st.session_state.get("camera_apont_ativa", False)
+    if camera_ativa:
+        st.session_state["camera_apont"] = decodificador_camera(st.session_state.get("camera_apont"))
+    elif st.session_state.get("camera_apont"):
+        st.session_state["camera_apont"]["ativo"] = False
+
+    def drenar_camera(processar):
+        estado = st.session_state.get("camera_apont")
+        if camera_ativa and estado:
+            for codigo in camera_codigos_lidos(estado):
+                processar(codigo)
+            st.caption(
+                f"📷 Frames decodificados: {estado['decodificados']} | "
+                f"descartados (decodificação em andamento): {estado['descartados']}"
+            )
+            if estado["ultimo_erro"]:
+                st.caption(f"⚠️ Câmera: {estado['ultimo_erro'][:120]}")
 
     # foco contínuo
     components.html(
@@ -706,85 +2245,508 @@ def pagina_apontamento():
         height=0,
     )
 
-    # feedback
-    col1, col2, col3 = st.columns([2, 2, 2])
-    col1.markdown(f"📦 Série: **{st.session_state.get('serie_pendente') or '-'}**")
-    col2.markdown(f"🧾 OP: **{st.session_state.get('op_pendente') or '-'}**")
-    col3.markdown(f"🏷️ Tipo: **{tipo_producao}**")
+    # ================================
+    # ✅ Leitor (fragment próprio): a leitura, os timers e o feedback reexecutam só
+    # este trecho, nunca login/menu/painel. O tick de 1s só existe com timer
+    # pendente (OP sem série, reset após sucesso) ou câmera ligada.
+    # ================================
+    def leitor_precisa_tick():
+        return bool(
+            camera_ativa
+            or st.session_state.get("op_ts")
+            or (st.session_state.get("reset_after_success") and st.session_state.get("success_ts"))
+        )
 
-    if st.session_state.get("erro_apont"):
-        st.warning(st.session_state["erro_apont"])
-        st.session_state["erro_apont"] = None
+    tick_leitor = leitor_precisa_tick()
+
+    @fragment(run_every=1 if tick_leitor else None)
+    @medir("fragment.leitor_apontamento")
+    def leitor_apontamento():
+        drenar_camera(processar_codigo_apont)
+
+        op_atual = (st.session_state.get("op_pendente") or "").strip()
+        serie_atual = (st.session_state.get("serie_pendente") or "").strip()
+
+        # Regras de tempo
+        if op_atual and not serie_atual and st.session_state.get("op_ts"):
+            if time.time() - st.session_state["op_ts"] >= OP_TIMEOUT_SEG:
+                resetar_leituras(
+                    limpar_msg=True, msg_erro="⏱️ Tempo expirado (4s). Bipe a OP novamente.", limpar_input=False
+                )
+
+        if st.session_state.get("reset_after_success") and st.session_state.get("success_ts"):
+            if time.time() - st.session_state["success_ts"] >= RESET_TIMEOUT_SEG:
+                resetar_leituras(limpar_msg=True, msg_erro=None, limpar_input=False)
+
+        # UI input
+        st.text_input(
+            "Leitor",
+            key="input_leitor_apont",
+            placeholder="Aproxime o leitor (OP 11 primeiro, depois Série 9)...",
+            label_visibility="collapsed",
+            on_change=processar_leitura_apont,
+        )
+
+        # feedback
+        col1, col2, col3 = st.columns([2, 2, 2])
+        col1.markdown(f"📦 Série: **{st.session_state.get('serie_pendente') or '-'}**")
+        col2.markdown(f"🧾 OP: **{st.session_state.get('op_pendente') or '-'}**")
+        col3.markdown(f"🏷️ Tipo: **{tipo_producao}**")
+
+        # as mensagens ficam até a próxima leitura ou reset
+        if st.session_state.get("erro_apont"):
+            st.warning(st.session_state["erro_apont"])
+
+        if st.session_state.get("msg_ok"):
+            st.success(st.session_state["msg_ok"])
+
+        fila = status_fila_apontamentos()
+        st.caption(f"📡 Fila local: **{fila['pendentes']}** apontamento(s) aguardando envio ao banco")
+        if fila["ultimo_erro"]:
+            st.caption(f"⚠️ Envio ao banco falhando, tentando novamente: {fila['ultimo_erro'][:120]}")
+        if fila["duplicados"]:
+            st.warning(
+                f"⚠️ Já registradas hoje por outra estação (descartadas): {', '.join(fila['duplicados'][-10:])}"
+            )
+        if fila["erros"]:
+            st.error(
+                "❌ Recusadas pelo banco (fora da fila, bipar de novo após corrigir): "
+                + "; ".join(f"{serie} ({(erro or '')[:80]})" for serie, erro in fila["erros"][-10:])
+            )
+
+        # timer começou ou acabou nesta leitura: rerun da página para ligar/desligar o tick
+        if leitor_precisa_tick() != tick_leitor:
+            st.rerun()
+
+    # ================================
+    # ✅ Leitor do modo lote (fragment próprio, sem timers)
+    # ================================
+    @fragment(run_every=1 if camera_ativa else None)
+    @medir("fragment.leitor_lote")
+    def leitor_lote():
+        drenar_camera(processar_codigo_lote)
+
+        st.text_input(
+            "Leitor (lote)",
+            key="input_lote_apont",
+            placeholder="Aproxime o leitor (OP 11 primeiro, depois Série 9)...",
+            label_visibility="collapsed",
+            on_change=processar_leitura_lote,
+        )
+
+        lote = st.session_state["lote_apont"]
+        col1, col2, col3 = st.columns([2, 2, 2])
+        col1.markdown(f"🧾 OP: **{st.session_state['lote_op'] or '-'}**")
+        col2.markdown(f"📦 No lote: **{len(lote)}**")
+        col3.markdown(f"🏷️ Tipo: **{tipo_producao}**")
+
+        if st.session_state["lote_msg"]:
+            tipo_msg, texto = st.session_state["lote_msg"]
+            (st.success if tipo_msg == "ok" else st.warning)(texto)
+
+        if lote:
+            col_gravar, col_descartar = st.columns(2)
+            if col_gravar.button(f"💾 Gravar lote ({len(lote)})", type="primary", use_container_width=True):
+                resultados = salvar_apontamentos_lote([(l["serie"], l["op"], l["tipo"], l["lido_em"]) for l in lote])
+                st.session_state["lote_resultados"] = [
+                    {"Série": l["serie"], "OP": l["op"], "Resultado": r} for l, r in zip(lote, resultados)
+                ]
+                # recusadas pelo banco continuam no lote para gravar de novo depois de corrigir
+                st.session_state["lote_apont"] = lote = [l for l, r in zip(lote, resultados) if r == "erro"]
+                if not lote:
+                    st.session_state["lote_op"] = ""
+                st.session_state["lote_msg"] = None
+            elif col_descartar.button("🗑️ Descartar lote", use_container_width=True):
+                st.session_state["lote_apont"] = lote = []
+                st.session_state["lote_op"] = ""
+                st.session_state["lote_msg"] = None
+
+        if lote:
+            st.dataframe(
+                pd.DataFrame(
+                    [{"OP": l["op"], "Série": l["serie"], "Hora": l["lido_em"].strftime("%H:%M:%S")} for l in lote]
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+        resultados = st.session_state["lote_resultados"]
+        if resultados:
+            df_res = pd.DataFrame(resultados)
+            resumo = df_res["Resultado"].value_counts()
+            st.success(
+                f"✅ Último lote: {resumo.get('inserido', 0)} inserido(s), "
+                f"{resumo.get('duplicado', 0)} já registrado(s) hoje, {resumo.get('enfileirado', 0)} na fila local."
+                + (f" {resumo['erro']} recusado(s) pelo banco (continuam no lote)." if resumo.get("erro") else "")
+            )
+            if (df_res["Resultado"] != "inserido").any():
+                st.dataframe(df_res[df_res["Resultado"] != "inserido"], use_container_width=True, hide_index=True)
+
+    col_lote, col_camera = st.columns(2)
+    modo_lote = col_lote.checkbox(
+        "📦 Modo lote (palete): acumula as leituras e grava tudo de uma vez", key="modo_lote_apont"
+    )
+    col_camera.checkbox("📷 Ler pela câmera", key="camera_apont_ativa")
+
+    if camera_ativa:
+        try:
+            from streamlit_webrtc import WebRtcMode, webrtc_streamer
+        except ImportError:
+            st.error("Leitura pela câmera precisa do pacote streamlit-webrtc.")
+        else:
+            estado_camera = st.session_state["camera_apont"]
+            webrtc_streamer(
+                key="camera_apontamento",
+                mode=WebRtcMode.SENDRECV,
+                video_frame_callback=lambda frame: camera_receber_frame(estado_camera, frame),
+                media_stream_constraints={"video": {"facingMode": "environment"}, "audio": False},
+                async_processing=True,
+            )
 
-    if st.session_state.get("msg_ok"):
-        st.success(st.session_state["msg_ok"])
-        # a limpeza vem pelo reset de 4s (tick)
+    if modo_lote:
+        leitor_lote()
+    else:
+        leitor_apontamento()
 
-    # Últimos 10
-    st.markdown("### 📋 Últimos 10 Apontamentos")
-    if not df_filtrado.empty:
-        ultimos = df_filtrado.sort_values("data_hora", ascending=False).head(10).copy()
-        ultimos["Hora"] = ultimos["data_hora"].dt.strftime("%d/%m/%Y %H:%M:%S")
+    # ================================
+    # ✅ Últimos 10 (fragment próprio): só refaz a tabela quando chegam dados novos
+    # ================================
+    @fragment(run_every=PAINEL_INTERVALO_SEG)
+    @medir("fragment.ultimos_apontamentos")
+    def ultimos_apontamentos():
+        st.markdown("### 📋 Últimos 10 Apontamentos")
+        chave = (versao_apontamentos(), tipo_producao)
+        if st.session_state.get("ultimos_apont_chave") != chave:
+            st.session_state["ultimos_apont"] = ultimos_apontamentos_do_dia(tipo_producao)
+            st.session_state["ultimos_apont_chave"] = chave
+
+        ultimos = st.session_state["ultimos_apont"]
+        if not ultimos.empty:
+            st.dataframe(
+                ultimos[["op", "numero_serie", "Hora"]],
+                use_container_width=True,
+                hide_index=True,
+            )
+        else:
+            st.info("Nenhum apontamento encontrado.")
+
+    ultimos_apontamentos()
+
+
+# ================================
+# Análise de qualidade (a partir dos agregados diários)
+# ================================
+def pagina_analise():
+    import plotly.express as px  # ✅ plotly só carrega quando esta página abre
+    import plotly.graph_objects as go
+
+    st.markdown("# 📊 Análise de Qualidade")
+
+    n_dias = st.selectbox(
+        "Período", [7, 30, 90, 365], index=1, format_func=lambda d: f"Últimos {d} dias", key="analise_periodo"
+    )
+    dados = analise_periodo(n_dias)
+    tendencia = dados["tendencia"]
+    if tendencia.empty:
+        st.info("Nenhum checklist no período.")
+        return
+
+    inspecoes = int(tendencia["inspecoes"].sum())
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Inspeções", inspecoes)
+    col2.metric("Aprovação de primeira", f"{tendencia['aprovadas'].sum() / inspecoes:.1%}" if inspecoes else "-")
+    col3.metric("Reinspeções", int(tendencia["reinspecoes"].sum()))
+
+    # ✅ Pareto: não conformidades por item + % acumulado
+    st.markdown("### Pareto de Não Conformidades por Item")
+    itens = dados["itens"]
+    itens = itens[itens["nao_conformes"] > 0].sort_values("nao_conformes", ascending=False)
+    if itens.empty:
+        st.success("Nenhuma não conformidade no período.")
+    else:
+        acumulado = itens["nao_conformes"].cumsum() / itens["nao_conformes"].sum() * 100
+        fig = go.Figure()
+        fig.add_bar(
+            x=itens["item"],
+            y=itens["nao_conformes"],
+            name="Não conformes",
+            customdata=itens["nao_conformes"] / itens["verificados"] * 100,
+            hovertemplate="%{x}: %{y} (%{customdata:.1f}% dos verificados)<extra></extra>",
+        )
+        fig.add_scatter(x=itens["item"], y=acumulado, name="% acumulado", yaxis="y2", mode="lines+markers")
+        fig.update_layout(
+            yaxis2=dict(overlaying="y", side="right", range=[0, 105], ticksuffix="%"),
+            legend=dict(orientation="h"),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    defeitos = dados["defeitos"]
+    if not defeitos.empty:
+        st.markdown("### Tipos de Defeito")
+        itens_defeito = sorted(defeitos["item"].unique())
+        item = st.selectbox(
+            "Item",
+            itens_defeito,
+            index=itens_defeito.index("SOLDA") if "SOLDA" in itens_defeito else 0,
+            key="analise_item_defeito",
+        )
+        fig = px.bar(
+            defeitos[defeitos["item"] == item].sort_values("ocorrencias", ascending=False), x="defeito", y="ocorrencias"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown("### Tendência Diária")
+    base = tendencia["inspecoes"].where(tendencia["inspecoes"] > 0)
+    tendencia = tendencia.assign(
+        aprovacao_primeira=tendencia["aprovadas"] / base * 100,
+        reinspecao=tendencia["reinspecoes"] / base * 100,
+    )
+    fig = px.line(
+        tendencia,
+        x="dia",
+        y=["aprovacao_primeira", "reinspecao"],
+        markers=True,
+        labels={"value": "%", "variable": "", "dia": ""},
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown("### Checklists por Inspetor")
+    inspetores = dados["inspetores"]
+    if not inspetores.empty:
+        fig = px.bar(inspetores.sort_values("hora"), x="hora", y="checklists", color="inspetor", barmode="group")
+        st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(dados["ritmo"].sort_values("checklists", ascending=False), use_container_width=True, hide_index=True)
+
+
+# ================================
+# Exportação de histórico
+# ================================
+def pagina_exportacao():
+    st.markdown("# 📤 Exportar Histórico")
+
+    tabela = st.radio("Tabela:", ["checklists", "apontamentos"], horizontal=True, key="exportacao_tabela")
+    formato = st.radio("Formato:", ["parquet", "csv"], horizontal=True, key="exportacao_formato")
+
+    hoje = datetime.datetime.now(TZ).date()
+    col1, col2, col3 = st.columns(3)
+    inicio = col1.date_input("De", value=hoje - datetime.timedelta(days=30), key="exportacao_inicio")
+    fim = col2.date_input("Até", value=hoje, key="exportacao_fim")
+    filtros = {"inicio": inicio, "fim": fim}
+    if tabela == "apontamentos":
+        tipo = col3.selectbox("Linha", ["Todas", "Eixo", "Manga", "PNM"], key="exportacao_linha")
+        filtros["tipo_producao"] = None if tipo == "Todas" else tipo
+    else:
+        inspetor = col3.selectbox("Inspetor", ["Todos"] + list(usuarios), key="exportacao_inspetor")
+        filtros["inspetor"] = None if inspetor == "Todos" else inspetor
+
+    st.caption("As fotos não entram no arquivo: só a chave, o tamanho e o hash de cada uma.")
+
+    if st.button("Gerar arquivo"):
+        extensao = "parquet" if formato == "parquet" else "csv.gz"
+        nome_arquivo = f"{tabela}_{inicio:%Y%m%d}_{fim:%Y%m%d}.{extensao}"
+        # arquivo temporário único por exportação: sessões simultâneas não se sobrescrevem
+        descritor, caminho = tempfile.mkstemp(prefix=f"{tabela}_", suffix=f".{extensao}")
+        os.close(descritor)
+        destino = Path(caminho)
+        try:
+            try:
+                with st.spinner("Exportando..."):
+                    total = exportar_tabela(tabela, destino, formato, **filtros)
+            except ImportError:
+                st.error("Exportação em Parquet precisa do pacote pyarrow. Use CSV ou instale o pyarrow.")
+                return
+            except Exception as e:
+                st.error(f"Erro ao exportar: {e}")
+                return
+
+            st.success(f"✅ {total} linha(s) exportada(s).")
+            # o download_button lê o conteúdo na hora: depois disso o arquivo pode sair do disco
+            st.download_button("⬇️ Baixar arquivo", destino.read_bytes(), file_name=nome_arquivo)
+        finally:
+            destino.unlink(missing_ok=True)
+
+
+# ================================
+# Diagnóstico (só admin)
+# ================================
+def pagina_diagnostico():
+    st.markdown("# 🩺 Diagnóstico de Desempenho")
+
+    linhas = resumo_metricas()
+    if linhas:
+        df = pd.DataFrame(linhas)
+        df["kb"] = (df.pop("bytes") / 1024).round(1)
+        df["segundos"] = df["segundos"].round(2)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
+        st.info("Nenhuma chamada medida ainda.")
+
+    hub = _hub_dados()
+    fila = status_fila_apontamentos()
+    col1, col2, col3 = st.columns(3)
+    col1.metric(
+        "Fila local (pendentes)",
+        fila["pendentes"],
+        f"{len(fila['erros'])} recusada(s)" if fila["erros"] else None,
+        delta_color="off",
+    )
+    col2.metric("Realtime", "conectado" if hub["realtime"] else "consulta periódica")
+    col3.metric(
+        "Hub atualizado há",
+        f"{time.time() - hub['atualizado_em']:.0f} s" if hub["atualizado_em"] else "-",
+    )
+    if hub["ultimo_erro"]:
+        st.warning(f"Hub: {hub['ultimo_erro']}")
+
+    st.markdown("#### Réplica local")
+    st.dataframe(
+        pd.DataFrame([{"tabela": t, **info} for t, info in status_replica().items()]),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    memoria = memoria_estruturas()
+    if memoria:
+        st.markdown("#### Memória")
         st.dataframe(
-            ultimos[["op", "numero_serie", "Hora"]],
+            pd.DataFrame({"estrutura": list(memoria), "kb": [round(b / 1024, 1) for b in memoria.values()]}),
             use_container_width=True,
             hide_index=True,
         )
-    else:
-        st.info("Nenhum apontamento encontrado.")
+
+    frio = _inicio_frio()
+    if frio["primeira_pintura"] is not None:
+        st.caption(
+            f"Início a frio do processo: imports {frio['imports'] * 1000:.0f} ms, "
+            f"primeira pintura {frio['primeira_pintura'] * 1000:.0f} ms"
+        )
+
+    st.download_button("⬇️ Baixar métricas (Prometheus)", metricas_prometheus(), file_name="metrics.txt")
+    if METRICAS_PORTA:
+        st.caption(f"Scraping em http://<servidor>:{METRICAS_PORTA}/metrics")
 
 
 # ==============================
 # APP PRINCIPAL
 # ==============================
+def codigos_para_inspecao():
+    """Séries apontadas hoje (na ordem do apontamento) que ainda não têm checklist."""
+    linhas = replica_consultar(
+        """
+        SELECT a.numero_serie FROM apontamentos a
+        WHERE a.dia = ?
+          AND NOT EXISTS (SELECT 1 FROM checklists c WHERE c.numero_serie = a.numero_serie)
+        GROUP BY a.numero_serie
+        ORDER BY MIN(a.data_hora)
+        """,
+        (datetime.datetime.now(TZ).date().isoformat(),),
+    )
+    return [r["numero_serie"] for r in linhas]
+
+
+def fila_reinspecao():
+    """{série: [itens não conformes]} das séries cujo checklist mais recente está reprovado.
+
+    Lê o resumo do último checklist por série (mantido a cada gravação na réplica),
+    então uma série reinspecionada e aprovada sai da fila na hora.
+    """
+    linhas = replica_consultar(
+        """
+        SELECT u.numero_serie, GROUP_CONCAT(c.item, '\n') AS itens
+        FROM checklists_ultimo u
+        LEFT JOIN checklists c
+          ON c.numero_serie = u.numero_serie AND c.data_hora = u.data_hora AND c.status = 'Não Conforme'
+        WHERE u.reprovado = 1
+        GROUP BY u.numero_serie
+        ORDER BY u.data_hora
+        """
+    )
+    return {r["numero_serie"]: r["itens"].split("\n") if r["itens"] else [] for r in linhas}
+
+
+def numeros_serie_para_reinspecao():
+    """Séries cujo checklist mais recente está reprovado (mais antigas primeiro)."""
+    return list(fila_reinspecao())
+
+
+def garantir_replica(hub):
+    """Réplica ainda vazia (primeira execução): espera a carga inicial antes de desenhar as telas."""
+    if _replica_marca("apontamentos") is not None and _replica_marca("checklists") is not None:
+        return
+    with st.spinner("Preparando a réplica local (primeira carga)..."):
+        try:
+            sincronizar_replica(hub)
+        except Exception as e:
+            st.error(f"Erro ao carregar dados: {e}")
+
+
 def app():
     login()
+    hub = _hub_dados()
+    garantir_replica(hub)
 
-    menu = st.sidebar.selectbox("Menu", ["Apontamento", "Inspeção de Qualidade", "Reinspeção"])
+    opcoes_menu = ["Apontamento", "Inspeção de Qualidade", "Reinspeção", "Análise", "Exportação"]
+    if st.session_state["usuario"] == "admin":
+        opcoes_menu.append("Diagnóstico")
+    menu = st.sidebar.selectbox("Menu", opcoes_menu)
 
-    if menu == "Apontamento":
-        pagina_apontamento()
+    if METRICAS_PORTA:
+        _servidor_metricas(METRICAS_PORTA)
 
-    elif menu == "Inspeção de Qualidade":
-        df_apont = carregar_apontamentos()
-        hoje = datetime.datetime.now(TZ).date()
+    if menu == "Apontamento" and st.sidebar.button("🔄 Ressincronizar apontamentos"):
+        ressincronizar_apontamentos()
 
-        if not df_apont.empty:
-            start_of_day = TZ.localize(datetime.datetime.combine(hoje, datetime.time.min))
-            end_of_day = TZ.localize(datetime.datetime.combine(hoje, datetime.time.max))
-            df_hoje = df_apont[(df_apont["data_hora"] >= start_of_day) & (df_apont["data_hora"] <= end_of_day)]
+    if menu in ("Inspeção de Qualidade", "Reinspeção", "Análise") and st.sidebar.button("🔄 Ressincronizar checklists"):
+        _replica_sincronizar("checklists", resync=True)
+        if _cache_analise()["carregado"]:
+            analise_periodo(1, resync=True)
 
-            df_hoje = df_hoje.sort_values(by="data_hora", ascending=True)
-            codigos_hoje = df_hoje.drop_duplicates(subset="numero_serie")["numero_serie"].tolist()
-        else:
-            codigos_hoje = []
+    # ✅ tempo de renderização de cada página vai para as métricas
+    with medir(f"pagina.{menu}"):
+        if menu == "Apontamento":
+            pagina_apontamento()
 
-        df_checks = carregar_checklists()
-        codigos_com_checklist = df_checks["numero_serie"].unique() if not df_checks.empty else []
-        codigos_disponiveis = [c for c in codigos_hoje if c not in codigos_com_checklist]
+        elif menu == "Inspeção de Qualidade":
+            codigos_disponiveis = codigos_para_inspecao()
 
-        if codigos_disponiveis:
-            numero_serie = st.selectbox("Selecione o Nº de Série para Inspeção", codigos_disponiveis, index=0)
-            usuario = st.session_state["usuario"]
-            checklist_qualidade(numero_serie, usuario)
-        else:
-            st.info("Nenhum código disponível para inspeção hoje.")
-
-    elif menu == "Reinspeção":
-        usuario = st.session_state["usuario"]
-        df_checks = carregar_checklists()
+            if codigos_disponiveis:
+                numero_serie = st.selectbox("Selecione o Nº de Série para Inspeção", codigos_disponiveis, index=0)
+                usuario = st.session_state["usuario"]
+                checklist_qualidade(numero_serie, usuario)
+            else:
+                st.info("Nenhum código disponível para inspeção hoje.")
 
-        if df_checks.empty:
-            st.info("Nenhum checklist registrado ainda.")
-        else:
-            df_reprovados = df_checks[(df_checks["produto_reprovado"] == "Sim") & (df_checks["reinspecao"] != "Sim")]
-            numeros_serie_reinspecao = df_reprovados["numero_serie"].unique() if not df_reprovados.empty else []
+        elif menu == "Reinspeção":
+            usuario = st.session_state["usuario"]
 
-            if len(numeros_serie_reinspecao) == 0:
-                st.info("Nenhum checklist reprovado pendente para reinspeção.")
+            if not replica_consultar("SELECT 1 FROM checklists LIMIT 1"):
+                st.info("Nenhum checklist registrado ainda.")
             else:
-                numero_serie = st.selectbox("Selecione o Nº de Série para Reinspeção", numeros_serie_reinspecao, index=0)
-                checklist_qualidade(numero_serie, usuario)
+                fila = fila_reinspecao()
+
+                if len(fila) == 0:
+                    st.info("Nenhum checklist reprovado pendente para reinspeção.")
+                else:
+                    numero_serie = st.selectbox(
+                        "Selecione o Nº de Série para Reinspeção",
+                        list(fila),
+                        index=0,
+                        format_func=lambda serie: f"{serie} – {', '.join(fila[serie]) or 'reprovado'}",
+                    )
+                    checklist_reinspecao(numero_serie, usuario)
+
+        elif menu == "Análise":
+            pagina_analise()
+
+        elif menu == "Exportação":
+            pagina_exportacao()
+
+        elif menu == "Diagnóstico":
+            pagina_diagnostico()
+
+    # ✅ página escolhida já desenhada (inclui a carga inicial da réplica no início a frio)
+    registrar_primeira_pintura()
+    _registrar_metrica("script.rerun", time.perf_counter() - _INICIO_SCRIPT)
 
     st.markdown(
         "<p style='text-align:center;color:gray;font-size:12px;margin-top:30px;'>Created by Engenharia de Produção</p>",
@@ -0,0 +1,18 @@
+-- Realtime dos INSERTs de apontamentos: o hub do app assina este canal e, conectado,
+-- só consulta a tabela de tempos em tempos. Sem a publicação nenhum evento chega.
+do $$
+begin
+    if not exists (
+        select 1 from pg_publication_tables
+        where pubname = 'supabase_realtime' and schemaname = 'public' and tablename = 'apontamentos'
+    ) then
+        alter publication supabase_realtime add table apontamentos;
+    end if;
+end;
+$$;
+
+-- Com RLS ligado o Realtime só entrega as linhas que a chave do app pode ler
+drop policy if exists apontamentos_leitura_app on apontamentos;
+create policy apontamentos_leitura_app on apontamentos
+    for select to anon, authenticated
+    using (true);
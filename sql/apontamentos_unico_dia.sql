@@ -0,0 +1,35 @@
+-- Duplicidade de apontamento garantida no banco: uma série por dia de produção (horário de SP).
+-- O app envia dia_producao e usa upsert com on conflict do nothing.
+alter table apontamentos add column if not exists dia_producao date;
+
+update apontamentos
+set dia_producao = (data_hora at time zone 'America/Sao_Paulo')::date
+where dia_producao is null;
+
+alter table apontamentos
+    alter column dia_producao set default ((now() at time zone 'America/Sao_Paulo')::date),
+    alter column dia_producao set not null;
+
+-- Duplicados antigos (mantém o primeiro apontamento do dia) saem da tabela antes da chave única,
+-- mas ficam guardados em apontamentos_duplicados_arquivo (com a data do arquivamento)
+create table if not exists apontamentos_duplicados_arquivo (
+    like apontamentos,
+    arquivado_em timestamptz not null default now()
+);
+
+with removidos as (
+    delete from apontamentos a
+    using apontamentos b
+    where a.numero_serie = b.numero_serie
+      and a.dia_producao = b.dia_producao
+      and a.id > b.id
+    returning a.*
+)
+insert into apontamentos_duplicados_arquivo
+select removidos.*, now() from removidos;
+
+-- Quantos foram arquivados (conferir antes de seguir)
+select count(*) as duplicados_arquivados from apontamentos_duplicados_arquivo;
+
+create unique index if not exists apontamentos_serie_dia_key
+    on apontamentos (numero_serie, dia_producao);
@@ -0,0 +1,10 @@
+-- Fotos da etiqueta fora da linha do checklist (blob store + miniatura)
+alter table checklists add column if not exists foto_chave text;
+alter table checklists add column if not exists foto_tamanho integer;
+alter table checklists add column if not exists foto_sha256 text;
+alter table checklists add column if not exists foto_miniatura text;
+
+-- Bucket do Supabase Storage usado por FOTOS_BUCKET
+insert into storage.buckets (id, name, public)
+values ('fotos-etiqueta', 'fotos-etiqueta', false)
+on conflict (id) do nothing;
@@ -0,0 +1,49 @@
+-- Último resultado de cada Nº de Série, mantido a cada insert, e a fila de reinspeção.
+-- Uma série reinspecionada e aprovada sai da fila: vale só o checklist mais recente.
+-- (as linhas de um mesmo checklist são gravadas juntas, com a mesma data_hora)
+create table if not exists checklists_ultimo (
+    numero_serie text primary key,
+    ultimo_id bigint not null,
+    data_hora timestamptz,
+    reprovado boolean not null
+);
+
+insert into checklists_ultimo (numero_serie, ultimo_id, data_hora, reprovado)
+select distinct on (numero_serie) numero_serie, id, data_hora, produto_reprovado = 'Sim'
+from checklists
+order by numero_serie, id desc
+on conflict (numero_serie) do nothing;
+
+create or replace function checklists_ultimo_atualizar() returns trigger
+language plpgsql as $$
+begin
+    insert into checklists_ultimo as u (numero_serie, ultimo_id, data_hora, reprovado)
+    select distinct on (numero_serie) numero_serie, id, data_hora, produto_reprovado = 'Sim'
+    from novas
+    order by numero_serie, id desc
+    on conflict (numero_serie) do update
+        set ultimo_id = excluded.ultimo_id, data_hora = excluded.data_hora, reprovado = excluded.reprovado
+        where excluded.ultimo_id > u.ultimo_id;
+    return null;
+end;
+$$;
+
+drop trigger if exists checklists_ultimo_trg on checklists;
+create trigger checklists_ultimo_trg
+    after insert on checklists
+    referencing new table as novas
+    for each statement execute function checklists_ultimo_atualizar();
+
+create index if not exists checklists_ultimo_reprovados on checklists_ultimo (data_hora) where reprovado;
+create index if not exists checklists_serie_data_hora on checklists (numero_serie, data_hora);
+
+-- Fila de reinspeção: séries com o último checklist reprovado e os itens não conformes dele
+create or replace view reinspecao_pendente as
+select
+    u.numero_serie,
+    u.data_hora,
+    coalesce(array_agg(c.item order by c.id) filter (where c.status = 'Não Conforme'), '{}') as itens_reprovados
+from checklists_ultimo u
+join checklists c on c.numero_serie = u.numero_serie and c.data_hora = u.data_hora
+where u.reprovado
+group by u.numero_serie, u.data_hora;